@@ -0,0 +1,209 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List
+
+# API user the current request runs for; set per request, inherited by its tasks
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default="anonymous")
+
+# Concurrent generations per model; Ollama serves only a few requests at a time
+DEFAULT_LIMITS = {
+    "local": 2,
+}
+
+class AdmissionRejected(Exception):
+    """A model is saturated and its wait queue is full (or the wait timed out)"""
+
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"Model {model} is at capacity, retry in {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+class ModelGate:
+    """Concurrency limit for one model with a bounded, weighted-fair wait queue.
+
+    Waiters are ordered by virtual finish time (start-time fair queuing): each
+    tenant's requests are spaced ``1 / weight`` apart in virtual time, so a
+    tenant with a burst of requests cannot starve the others, and a tenant with
+    weight 2 gets twice the share of a tenant with weight 1.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float, weights: Dict[str, float]):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.weights = weights
+        self.active = 0
+        self.rejected = 0
+        self._waiters: List = []
+        self._waiting = 0
+        self._virtual_time = 0.0
+        self._finish: Dict[str, float] = {}
+        self._seq = itertools.count()
+        # Smoothed time a slot is held, used for Retry-After
+        self._service_time = 1.0
+
+    def depth(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._service_time * (self._waiting + 1) / self.limit))
+
+    def full(self) -> bool:
+        return self.active >= self.limit and self._waiting >= self.max_queue
+
+    async def acquire(self, tenant: str):
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after())
+
+        tag = max(self._virtual_time, self._finish.get(tenant, 0.0)) + 1 / self.weights.get(tenant, 1.0)
+        self._finish[tenant] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (tag, next(self._seq), future))
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._waiting -= 1
+                self.rejected += 1
+                raise AdmissionRejected(self.name, self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as the caller went away: pass it on
+                self.release(0.0)
+            elif not future.done():
+                future.cancel()
+                self._waiting -= 1
+            raise
+
+    def release(self, held: float):
+        if held:
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+        while self._waiters:
+            tag, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            # Hand the slot straight to the next waiter
+            self._waiting -= 1
+            self._virtual_time = tag
+            future.set_result(None)
+            return
+        self.active -= 1
+        if not self.active:
+            # Idle: forget old virtual times so they do not grow without bound
+            self._virtual_time = 0.0
+            self._finish.clear()
+
+class AdmissionController:
+    """Per-model admission control for model backends.
+
+    Each model gets ``limit`` concurrent generations; further requests wait in a
+    queue of at most ``max_queue`` and are admitted fairly across API users
+    (weighted by ``weights``). Requests beyond that are rejected immediately with
+    a Retry-After estimate instead of piling onto a saturated backend.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int] = None,
+        default_limit: int = 32,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+        weights: Dict[str, float] = None
+    ):
+        self.limits = limits or dict(DEFAULT_LIMITS)
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.weights = weights or {}
+        self._gates: Dict[str, ModelGate] = {}
+
+    @classmethod
+    def from_env(cls, model_names) -> "AdmissionController":
+        """Build from ADMISSION_LIMIT[_<MODEL>] / ADMISSION_MAX_QUEUE / ADMISSION_QUEUE_TIMEOUT / API_KEY_WEIGHTS"""
+        limits = dict(DEFAULT_LIMITS)
+        # The local default is per Ollama host, so a pool of hosts gets a proportional share
+        hosts = [url for url in os.getenv("OLLAMA_HOSTS", "").split(",") if url.strip()]
+        if hosts:
+            limits["local"] = DEFAULT_LIMITS["local"] * len(hosts)
+        for name in model_names:
+            value = os.getenv(f"ADMISSION_LIMIT_{name.upper()}")
+            if value:
+                limits[name] = int(value)
+        weights = {}
+        for item in os.getenv("API_KEY_WEIGHTS", "").split(","):
+            if ":" in item:
+                user, weight = item.split(":", 1)
+                weights[user.strip()] = float(weight)
+        return cls(
+            limits=limits,
+            default_limit=int(os.getenv("ADMISSION_LIMIT", "32")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+            weights=weights
+        )
+
+    def gate(self, name: str) -> ModelGate:
+        if name not in self._gates:
+            self._gates[name] = ModelGate(
+                name,
+                self.limits.get(name, self.default_limit),
+                self.max_queue,
+                self.queue_timeout,
+                self.weights
+            )
+        return self._gates[name]
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        """Hold one of the model's generation slots for the duration of the block"""
+        gate = self.gate(name)
+        await gate.acquire(current_tenant.get())
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            gate.release(time.monotonic() - started)
+
+    def wrap(self, name: str, model) -> "AdmittedModel":
+        self.gate(name)
+        return AdmittedModel(self, name, model)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-model concurrency and queue depth for the health endpoint"""
+        return {
+            name: {"active": gate.active, "limit": gate.limit, "queued": gate.depth(), "rejected": gate.rejected}
+            for name, gate in self._gates.items()
+        }
+
+class AdmittedModel:
+    """Model wrapper that takes an admission slot around every generation"""
+
+    def __init__(self, controller: AdmissionController, name: str, model):
+        self.controller = controller
+        self.name = name
+        self.model = model
+
+    def __getattr__(self, attr):
+        return getattr(self.model, attr)
+
+    async def generate_response(self, *args, **kwargs) -> str:
+        async with self.controller.slot(self.name):
+            return await self.model.generate_response(*args, **kwargs)
+
+    async def stream_response(self, *args, **kwargs) -> AsyncIterator[str]:
+        async with self.controller.slot(self.name):
+            async for chunk in self.model.stream_response(*args, **kwargs):
+                yield chunk
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .compression import Compressor
+
+# Default Redis TTLs (seconds) per copilot type. Debugging answers are tied to very
+# specific code, so they are kept for less time.
+DEFAULT_TTLS = {
+    "general": 3600,
+    "python": 3600,
+    "javascript": 3600,
+    "debug": 900,
+}
+
+class LRUCache:
+    """Bounded in-process cache with LRU eviction and per-entry expiry.
+
+    Evicts least recently used entries once either ``max_entries`` or
+    ``max_bytes`` (total length of the stored strings) is exceeded.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: float):
+        self.delete(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+def history_fingerprint(history: List[Dict]) -> str:
+    """Stable digest of the conversation so far (roles and contents only)"""
+    digest = hashlib.sha256()
+    for msg in history:
+        digest.update(msg["role"].encode())
+        digest.update(b"\0")
+        digest.update(msg["content"].encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ResponseCache:
+    """Two-tier response cache: in-process LRU (L1) in front of Redis (L2).
+
+    Keys cover everything that shapes the answer -- model, copilot type, system
+    prompt and conversation history -- so a response is only reused for an
+    identical request. Redis TTLs follow a per-copilot policy; L1 entries live at
+    most ``l1_ttl`` seconds. Redis writes go through ``writer`` when given (e.g. a
+    write-behind queue). Values are compressed in Redis by ``compressor``; L1
+    holds them decompressed.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        l1: Optional[LRUCache] = None,
+        l1_ttl: float = 300,
+        ttls: Dict[str, int] = None,
+        writer=None,
+        compressor: Optional[Compressor] = None
+    ):
+        self.redis = redis_client
+        self.writer = writer or redis_client
+        self.compressor = compressor or Compressor(enabled=False)
+        self.l1 = l1 if l1 is not None else LRUCache()
+        self.l1_ttl = l1_ttl
+        self.ttls = ttls or dict(DEFAULT_TTLS)
+
+    @classmethod
+    def from_env(cls, redis_client, writer=None, compressor: Optional[Compressor] = None) -> "ResponseCache":
+        """Build from CACHE_L1_* and CACHE_TTL_<COPILOT> settings"""
+        ttls = dict(DEFAULT_TTLS)
+        for copilot_type in ttls:
+            value = os.getenv(f"CACHE_TTL_{copilot_type.upper()}")
+            if value:
+                ttls[copilot_type] = int(value)
+        return cls(
+            redis_client,
+            l1=LRUCache(
+                max_entries=int(os.getenv("CACHE_L1_MAX_ENTRIES", "1024")),
+                max_bytes=int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+            ),
+            l1_ttl=float(os.getenv("CACHE_L1_TTL", "300")),
+            ttls=ttls,
+            writer=writer,
+            compressor=compressor
+        )
+
+    @staticmethod
+    def key(prompt: str, model: str, copilot_type: str, system_prompt: str, history: List[Dict]) -> str:
+        """Build the cache key for a fully specified request"""
+        payload = json.dumps([
+            hashlib.sha256(system_prompt.encode()).hexdigest(),
+            history_fingerprint(history),
+            prompt
+        ])
+        return f"cache:{model}:{copilot_type}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def ttl_for(self, copilot_type: str) -> int:
+        return self.ttls.get(copilot_type, self.ttls["general"])
+
+    async def get(self, key: str, copilot_type: str = "general") -> Optional[str]:
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+        value = self.compressor.decode(await self.redis.get(key))
+        if value:
+            self.l1.set(key, value, min(self.l1_ttl, self.ttl_for(copilot_type)))
+            return value
+        return None
+
+    async def get_many(self, keys: List[str], copilot_types: List[str]) -> List[Optional[str]]:
+        """Bulk lookup: L1 first, then a single MGET for everything L1 missed"""
+        values = [self.l1.get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            fetched = await self.redis.mget([keys[i] for i in missing])
+            for i, value in zip(missing, fetched):
+                value = self.compressor.decode(value)
+                if value:
+                    values[i] = value
+                    self.l1.set(keys[i], value, min(self.l1_ttl, self.ttl_for(copilot_types[i])))
+        return values
+
+    async def set(self, key: str, value: str, copilot_type: str = "general"):
+        ttl = self.ttl_for(copilot_type)
+        self.l1.set(key, value, min(self.l1_ttl, ttl))
+        await self.writer.setex(key, ttl, self.compressor.encode(value))
+
+    def stats(self) -> Dict[str, int]:
+        return {"l1_entries": len(self.l1), "l1_bytes": self.l1.size}
@@ -0,0 +1,95 @@
+import importlib.util
+import os
+
+import httpx
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (installed via httpx[http2])"""
+    return importlib.util.find_spec("h2") is not None
+
+class ProviderClients:
+    """Long-lived, pooled HTTP clients shared by every model backend.
+
+    Created once in the app lifespan and closed on shutdown, so requests reuse
+    keep-alive connections instead of paying TCP/TLS setup on every call.
+
+    Environment:
+        HTTP_MAX_CONNECTIONS     max open connections per provider (default 100)
+        HTTP_MAX_KEEPALIVE       idle connections kept per provider (default 20)
+        HTTP_KEEPALIVE_EXPIRY    seconds an idle connection is kept (default 30)
+        HTTP_CONNECT_TIMEOUT     connect timeout in seconds (default 5)
+        HTTP2_ENABLED            use HTTP/2 for cloud providers when h2 is installed (default true)
+        OPENAI_TIMEOUT / ANTHROPIC_TIMEOUT / OLLAMA_TIMEOUT   read timeouts in seconds (default 60)
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = _env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.connect_timeout = _env_float("HTTP_CONNECT_TIMEOUT", 5.0)
+        self.http2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and http2_available()
+
+        # Created on first use: importing the SDKs is the slowest part of startup
+        self._openai = None
+        self._anthropic = None
+        self._ollama = None
+
+    @property
+    def openai(self):
+        if self._openai is None:
+            import openai
+            # The SDKs pin their own httpx flavour, so their pools are built from the SDK's exports
+            self._openai = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=self._sdk_http_client(openai, "OPENAI_TIMEOUT")
+            )
+        return self._openai
+
+    @property
+    def anthropic(self):
+        if self._anthropic is None:
+            import anthropic
+            self._anthropic = anthropic.AsyncAnthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                http_client=self._sdk_http_client(anthropic, "ANTHROPIC_TIMEOUT")
+            )
+        return self._anthropic
+
+    @property
+    def ollama(self) -> httpx.AsyncClient:
+        if self._ollama is None:
+            # Ollama only speaks HTTP/1.1
+            self._ollama = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(_env_float("OLLAMA_TIMEOUT", 60.0), connect=self.connect_timeout),
+            )
+        return self._ollama
+
+    def _sdk_http_client(self, sdk, timeout_env: str):
+        """Build a pooled HTTP client for an OpenAI/Anthropic SDK"""
+        limits_type = type(sdk.DEFAULT_CONNECTION_LIMITS)
+        return sdk.DefaultAsyncHttpxClient(
+            limits=limits_type(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=sdk.Timeout(_env_float(timeout_env, 60.0), connect=self.connect_timeout),
+            http2=self.http2,
+        )
+
+    async def close(self):
+        """Close every pooled connection"""
+        if self._openai is not None:
+            await self._openai.close()
+        if self._anthropic is not None:
+            await self._anthropic.close()
+        if self._ollama is not None:
+            await self._ollama.aclose()
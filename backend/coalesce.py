@@ -0,0 +1,103 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .scripts import Script
+
+# Delete the lock only if it still holds our token (compare-and-delete in one step)
+RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def _release_local(store, keys: List[str], args: List) -> int:
+    """In-process implementation of RELEASE_LUA for local stores"""
+    if store.sync_get(keys[0]) == args[0]:
+        return store.sync_delete(keys[0])
+    return 0
+
+RELEASE_SCRIPT = Script(RELEASE_LUA, _release_local)
+
+class SingleFlight:
+    """Coalesce concurrent identical requests into a single upstream call.
+
+    Callers that arrive while a call for the same key is already running await
+    that call instead of starting their own. The work runs in its own task, so a
+    caller disconnecting does not cancel it for everyone else.
+
+    With a Redis client, a short-lived ``SET NX PX`` lock extends this across
+    worker processes: workers that lose the lock poll ``fetch`` (normally the
+    cache lookup) until the lock holder has stored its result.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        lock_ttl: float = 60.0,
+        poll_interval: float = 0.1
+    ):
+        self.redis = redis_client
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls, redis_client) -> "SingleFlight":
+        """Build from COALESCE_DISTRIBUTED / COALESCE_LOCK_TTL / COALESCE_POLL_INTERVAL"""
+        distributed = os.getenv("COALESCE_DISTRIBUTED", "false").lower() == "true"
+        return cls(
+            redis_client=redis_client if distributed else None,
+            lock_ttl=float(os.getenv("COALESCE_LOCK_TTL", "60")),
+            poll_interval=float(os.getenv("COALESCE_POLL_INTERVAL", "0.1")),
+        )
+
+    def inflight(self) -> int:
+        """Number of distinct keys currently being generated in this process"""
+        return len(self._inflight)
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        fetch: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """Run ``fn`` once per key across concurrent callers and return its result.
+
+        ``fn`` is expected to store its result where ``fetch`` can find it before
+        returning; ``fetch`` is only used when coalescing across workers.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, fn, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _run(self, key, fn, fetch) -> Any:
+        if self.redis is None or fetch is None:
+            return await fn()
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        if await self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+            try:
+                return await fn()
+            finally:
+                await self._release(lock_key, token)
+
+        # Another worker is generating: wait for its result to land
+        while True:
+            result = await fetch()
+            if result:
+                return result
+            if not await self.redis.get(lock_key):
+                # Lock released (or expired) without a result; generate ourselves
+                return await fn()
+            await asyncio.sleep(self.poll_interval)
+
+    async def _release(self, lock_key: str, token: str):
+        # Only release a lock we still hold; it may have expired and been re-acquired
+        await RELEASE_SCRIPT(self.redis, [lock_key], [token])
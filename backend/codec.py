@@ -0,0 +1,73 @@
+import base64
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: falls back to the standard json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency: only needed for STORAGE_CODEC=msgpack
+    msgpack = None
+
+# Prefix of msgpack values. Redis clients run with decode_responses=True, so the
+# binary encoding is stored base64-encoded; JSON values have no prefix.
+MSGPACK_MARKER = "m1:"
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text (orjson when installed); used for API payloads and stored JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+def loads(value) -> Any:
+    """Parse JSON text; raises ValueError on malformed input"""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+class Codec:
+    """Serializes stored values (history messages, summaries, index entries).
+
+    ``name`` picks the write format: ``json`` (standard library), ``orjson`` or
+    ``msgpack``. Reading detects the format of each value, so entries written
+    with another codec (including plain ``json.dumps`` output from before this
+    layer existed) still load after switching.
+    """
+
+    def __init__(self, name: str = "orjson"):
+        if name == "orjson" and orjson is None:
+            name = "json"
+        if name == "msgpack" and msgpack is None:
+            print("[WARNING] STORAGE_CODEC=msgpack but msgpack is not installed; storing JSON instead.")
+            name = "orjson" if orjson is not None else "json"
+        if name not in ("json", "orjson", "msgpack"):
+            raise ValueError(f"Unknown storage codec: {name}")
+        self.name = name
+
+    @classmethod
+    def from_env(cls) -> "Codec":
+        """Build from STORAGE_CODEC (json, orjson or msgpack; default orjson when installed)"""
+        return cls(os.getenv("STORAGE_CODEC", "orjson"))
+
+    def encode(self, obj: Any) -> str:
+        if self.name == "msgpack":
+            return MSGPACK_MARKER + base64.b64encode(msgpack.packb(obj)).decode("ascii")
+        if self.name == "orjson":
+            return orjson.dumps(obj).decode()
+        return json.dumps(obj, separators=(",", ":"))
+
+    @staticmethod
+    def decode(value: str) -> Any:
+        """Load a stored value in any supported format; raises ValueError if malformed"""
+        if value.startswith(MSGPACK_MARKER):
+            if msgpack is None:
+                raise ValueError("msgpack value found but msgpack is not installed")
+            try:
+                return msgpack.unpackb(base64.b64decode(value[len(MSGPACK_MARKER):], validate=True))
+            except Exception as e:
+                raise ValueError(f"Malformed msgpack value: {e}") from e
+        return loads(value)
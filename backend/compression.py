@@ -0,0 +1,71 @@
+import base64
+import binascii
+import os
+import zlib
+from typing import Dict, Optional
+
+# Prefix of compressed values. Redis clients run with decode_responses=True, so the
+# zlib stream is stored base64-encoded; values without the prefix are plain text.
+MARKER = "z1:"
+
+class Compressor:
+    """Transparent compression of values stored in Redis (or the memory store).
+
+    Values of at least ``min_bytes`` characters are zlib-compressed and stored as
+    ``MARKER`` + base64. A value is only stored compressed if that makes it
+    smaller, so short or incompressible text is left alone. ``decode`` accepts
+    both forms, so values written before compression was enabled still read.
+    """
+
+    def __init__(self, enabled: bool = True, min_bytes: int = 512, level: int = 6):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.level = level
+        # Running totals for the compression ratio on /metrics
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    @classmethod
+    def from_env(cls) -> "Compressor":
+        """Build from COMPRESSION_ENABLED / COMPRESSION_MIN_BYTES / COMPRESSION_LEVEL"""
+        return cls(
+            enabled=os.getenv("COMPRESSION_ENABLED", "true").lower() == "true",
+            min_bytes=int(os.getenv("COMPRESSION_MIN_BYTES", "512")),
+            level=int(os.getenv("COMPRESSION_LEVEL", "6"))
+        )
+
+    def encode(self, value: str) -> str:
+        """Value as stored: compressed if enabled, large enough and worth it"""
+        stored = value
+        # Plain text that happens to start with the marker is always compressed so
+        # that decode cannot mistake it for a compressed value
+        if self.enabled and (len(value) >= self.min_bytes or value.startswith(MARKER)):
+            packed = MARKER + base64.b64encode(zlib.compress(value.encode(), self.level)).decode("ascii")
+            if len(packed) < len(value) or value.startswith(MARKER):
+                stored = packed
+        self.raw_bytes += len(value)
+        self.stored_bytes += len(stored)
+        return stored
+
+    @staticmethod
+    def decode(value: Optional[str]) -> Optional[str]:
+        """Original value of a stored one (compressed or not)"""
+        if not value or not value.startswith(MARKER):
+            return value
+        try:
+            return zlib.decompress(base64.b64decode(value[len(MARKER):], validate=True)).decode()
+        except (binascii.Error, zlib.error, UnicodeDecodeError):
+            # Written as plain text before compression existed
+            return value
+
+    def ratio(self) -> float:
+        """Raw bytes per stored byte over everything encoded so far"""
+        return self.raw_bytes / self.stored_bytes if self.stored_bytes else 1.0
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.ratio(), 3)
+        }
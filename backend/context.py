@@ -0,0 +1,229 @@
+import asyncio
+import math
+import os
+from typing import Dict, List, Optional
+
+from .codec import Codec
+from .compression import Compressor
+
+# Prompt token budgets (conversation context + prompt) per model choice
+DEFAULT_BUDGETS = {
+    "gpt4": 8000,
+    "gpt35": 4000,
+    "claude": 8000,
+    "local": 1500,
+}
+
+# Per-message framing overhead (role markers, separators) in tokens
+MESSAGE_OVERHEAD = 4
+
+# Longest single message (in characters) fed to the summarizer
+SUMMARY_INPUT_CHARS = 4000
+
+SUMMARY_PROMPT = """You maintain a running summary of a programming assistant conversation.
+Merge the previous summary and the new messages into one concise summary (at most 200 words).
+Keep facts the assistant needs later: the user's goal, languages and libraries, code identifiers,
+errors seen, and decisions made. Omit pleasantries and full code listings."""
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about 4 characters per token for English and code)"""
+    return math.ceil(len(text) / 4) + MESSAGE_OVERHEAD
+
+def message_tokens(message: Dict) -> int:
+    """Token count of a stored message, using the count cached when it was written"""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = message["tokens"] = estimate_tokens(message["content"])
+    return tokens
+
+class ContextBuilder:
+    """Packs conversation history into a per-model token budget.
+
+    Messages are added newest first until the budget (minus the system prompt and
+    the new prompt) is used up. Older turns are periodically folded into a rolling
+    summary, generated in the background by the cheapest model and stored next to
+    the conversation; it is sent as a leading system message. The summary records
+    how many messages of the conversation list it covers, so only later messages
+    are sent verbatim.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        writer=None,
+        budgets: Dict[str, int] = None,
+        max_messages: int = 50,
+        summary_model: str = "gpt35",
+        summary_trigger: int = 12,
+        keep_recent: int = 4,
+        ttl: int = 86400,
+        compressor: Optional[Compressor] = None,
+        codec: Optional[Codec] = None
+    ):
+        self.redis = redis_client
+        self.writer = writer or redis_client
+        # Stored messages may be compressed (see add_to_conversation)
+        self.compressor = compressor or Compressor(enabled=False)
+        self.codec = codec or Codec()
+        self.budgets = budgets or dict(DEFAULT_BUDGETS)
+        self.max_messages = max_messages
+        self.summary_model = summary_model
+        self.summary_trigger = summary_trigger
+        # The new exchange (2 messages) is always kept verbatim
+        self.keep_recent = max(2, keep_recent)
+        self.ttl = ttl
+        self._summarizing = set()
+        self._tasks = set()
+
+    @classmethod
+    def from_env(
+        cls,
+        redis_client,
+        writer=None,
+        compressor: Optional[Compressor] = None,
+        codec: Optional[Codec] = None
+    ) -> "ContextBuilder":
+        """Build from CONTEXT_BUDGET_<MODEL> / CONTEXT_MAX_MESSAGES / SUMMARY_* settings"""
+        budgets = dict(DEFAULT_BUDGETS)
+        for model_choice in budgets:
+            value = os.getenv(f"CONTEXT_BUDGET_{model_choice.upper()}")
+            if value:
+                budgets[model_choice] = int(value)
+        return cls(
+            redis_client,
+            writer=writer,
+            budgets=budgets,
+            max_messages=int(os.getenv("CONTEXT_MAX_MESSAGES", "50")),
+            summary_model=os.getenv("SUMMARY_MODEL", "gpt35"),
+            summary_trigger=int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "12")),
+            keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", "4")),
+            compressor=compressor,
+            codec=codec
+        )
+
+    @staticmethod
+    def conversation_key(session_id: str) -> str:
+        return f"conversation:{session_id}"
+
+    @staticmethod
+    def summary_key(session_id: str) -> str:
+        return f"conversation_summary:{session_id}"
+
+    def budget_for(self, model_choice: str) -> int:
+        return self.budgets.get(model_choice, min(self.budgets.values()))
+
+    def queue_read(self, pipe, session_id: str):
+        """Queue the reads ``parse`` needs: list length, recent messages and summary"""
+        key = self.conversation_key(session_id)
+        pipe.llen(key)
+        pipe.lrange(key, -self.max_messages, -1)
+        pipe.get(self.summary_key(session_id))
+
+    def parse(self, length: int, raw_messages: List[str], raw_summary: Optional[str]) -> Dict:
+        """Session state from ``queue_read`` replies: unsummarized messages and the summary"""
+        summary = None
+        if raw_summary:
+            try:
+                summary = Codec.decode(raw_summary)
+            except ValueError:
+                summary = None
+        if summary and summary["covered"] > length:
+            # The conversation expired or was cleared after the summary was written
+            summary = None
+        covered = summary["covered"] if summary else 0
+
+        # Absolute position in the conversation list of the first fetched message
+        start = length - len(raw_messages)
+        messages = []
+        for offset, raw in enumerate(raw_messages):
+            if start + offset < covered:
+                continue
+            try:
+                message = Codec.decode(self.compressor.decode(raw))
+            except (ValueError, TypeError):
+                continue
+            if not isinstance(message, dict) or "role" not in message or "content" not in message:
+                continue
+            message["index"] = start + offset
+            messages.append(message)
+        return {"length": length, "messages": messages, "summary": summary}
+
+    def build(self, state: Dict, model_choice: str, system_prompt: str, prompt: str) -> List[Dict]:
+        """Conversation history for the model, packed into its token budget"""
+        budget = self.budget_for(model_choice) - estimate_tokens(system_prompt) - estimate_tokens(prompt)
+        summary = state["summary"]
+        if summary and summary["tokens"] <= budget:
+            budget -= summary["tokens"]
+        else:
+            summary = None
+
+        packed = []
+        for message in reversed(state["messages"]):
+            tokens = message_tokens(message)
+            if tokens > budget:
+                break
+            budget -= tokens
+            packed.append({"role": message["role"], "content": message["content"]})
+        packed.reverse()
+
+        # Start on a user turn so the roles keep alternating
+        while packed and packed[0]["role"] != "user":
+            packed.pop(0)
+        if summary:
+            packed.insert(0, {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary['content']}"
+            })
+        return packed
+
+    def maybe_summarize(self, session_id: str, state: Dict, model):
+        """Fold older turns into the summary in the background once enough pile up.
+
+        Called after the new exchange has been stored; ``state`` is the state read
+        before it, so two more messages now follow ``state["messages"]``.
+        """
+        messages = state["messages"]
+        if model is None or session_id in self._summarizing:
+            return
+        if len(messages) + 2 <= self.summary_trigger:
+            return
+
+        older = messages[:len(messages) + 2 - self.keep_recent]
+        if not older:
+            return
+        self._summarizing.add(session_id)
+        task = asyncio.create_task(self._summarize(session_id, state["summary"], older, model))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session_id: str, summary: Optional[Dict], older: List[Dict], model):
+        try:
+            transcript = "\n\n".join(
+                f"{message['role']}: {message['content'][:SUMMARY_INPUT_CHARS]}"
+                for message in older
+            )
+            previous = summary["content"] if summary else "(none)"
+            content = await model.generate_response(
+                user_prompt=f"Previous summary:\n{previous}\n\nNew messages:\n{transcript}",
+                system_prompt=SUMMARY_PROMPT
+            )
+            # The local model reports some failures as text; storing one would lose the covered turns
+            is_error = getattr(model, "is_error", None)
+            if is_error and is_error(content):
+                raise RuntimeError(content)
+            new_summary = {
+                "content": content,
+                "tokens": estimate_tokens(content),
+                "covered": older[-1]["index"] + 1
+            }
+            await self.writer.setex(self.summary_key(session_id), self.ttl, self.codec.encode(new_summary))
+        except Exception as e:
+            print(f"[WARNING] Conversation summary failed for {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    async def close(self):
+        """Cancel summaries still being generated"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,86 +1,44 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi import FastAPI, Request, Response, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
 import nest_asyncio
 from dotenv import load_dotenv
 import os
 import time
-import hashlib
-import json
 import redis.asyncio as redis
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Optional, Dict, List
 import asyncio
 from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv()
 
-# Import AI models
-from .models.openai_model import OpenAIModel
-from .models.claude_model import ClaudeModel
-from .models.local_model import LocalModel
+# AI models are imported lazily by the registry
+from .registry import ModelRegistry
+from .clients import ProviderClients
+from .coalesce import SingleFlight
+from .semantic_cache import SemanticCache
+from .cache import ResponseCache
+from .rate_limit import RateLimiter, rate_limit_headers
+from .write_behind import WriteBehindQueue
+from .memory_store import MemoryStore
+from .sqlite_store import SqliteStore
+from .compression import Compressor
+from .codec import Codec, dumps as json_dumps, orjson
+from .context import ContextBuilder, estimate_tokens
+from .router import ModelRouter, RoutedModel
+from .admission import AdmissionController, AdmissionRejected, current_tenant
+from .metering import UsageMeter, QuotaExceeded
+from . import metrics
 
 # Redis connection pool
 redis_pool = None
 
-class MockRedis:
-    """In-memory Redis fallback"""
-    def __init__(self):
-        self.data = {}
-        self.expiries = {}
-        print("[WARNING] Redis unavailable. Using in-memory storage (data will be lost on restart).")
-
-    async def get(self, key):
-        self._clean_expired()
-        return self.data.get(key)
-        
-    async def setex(self, key, time, value):
-        self.data[key] = value
-        self.expiries[key] = datetime.now().timestamp() + time
-        return True
-        
-    async def incr(self, key):
-        self._clean_expired()
-        val = int(self.data.get(key, 0)) + 1
-        self.data[key] = str(val)
-        return val
-        
-    async def lrange(self, key, start, end):
-        self._clean_expired()
-        lst = self.data.get(key, [])
-        if not isinstance(lst, list): return []
-        if end == -1: return lst[start:]
-        return lst[start:end+1]
-        
-    async def rpush(self, key, value):
-        if key not in self.data: self.data[key] = []
-        self.data[key].append(value)
-        return len(self.data[key])
-        
-    async def expire(self, key, time):
-        if key in self.data:
-            self.expiries[key] = datetime.now().timestamp() + time
-        return True
-        
-    async def delete(self, key):
-        if key in self.data: del self.data[key]
-        if key in self.expiries: del self.expiries[key]
-        return 1
-        
-    async def ping(self):
-        return True
-
-    async def close(self):
-        pass
-
-    def _clean_expired(self):
-        now = datetime.now().timestamp()
-        keys_to_del = [k for k, t in self.expiries.items() if t < now]
-        for k in keys_to_del:
-            if k in self.data: del self.data[k]
-            if k in self.expiries: del self.expiries[k]
+# Kept for backwards compatibility: the in-memory fallback used when Redis is unavailable
+MockRedis = MemoryStore
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -88,28 +46,108 @@ async def lifespan(app: FastAPI):
     global redis_pool
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
     
-    try:
-        redis_pool = redis.ConnectionPool.from_url(
-            redis_url,
-            decode_responses=True,
-            socket_connect_timeout=2
-        )
-        r = redis.Redis(connection_pool=redis_pool)
-        await r.ping()
-        app.state.redis = r
-        print(f"[INFO] Connected to Redis at {redis_url}")
-    except Exception as e:
-        print(f"[WARNING] Could not connect to Redis: {e}")
-        app.state.redis = MockRedis()
+    app.state.redis = None
+    if redis_url.startswith("sqlite://"):
+        # sqlite://<path>: local store shared by all workers on this host
+        app.state.redis = SqliteStore.from_env(path=redis_url[len("sqlite://"):] or None)
+        print(f"[INFO] Using the SQLite store at {app.state.redis.path}")
+    elif redis_url != "memory://":
+        try:
+            redis_pool = redis.ConnectionPool.from_url(
+                redis_url,
+                decode_responses=True,
+                socket_connect_timeout=2
+            )
+            r = redis.Redis(connection_pool=redis_pool)
+            await r.ping()
+            app.state.redis = r
+            print(f"[INFO] Connected to Redis at {redis_url}")
+        except Exception as e:
+            print(f"[WARNING] Could not connect to Redis: {e}")
+        if app.state.redis is None and os.getenv("LOCAL_STORE", "memory").lower() == "sqlite":
+            app.state.redis = SqliteStore.from_env()
+            print(f"[WARNING] Redis unavailable. Using the SQLite store at {app.state.redis.path} (shared by workers on this host).")
+    if app.state.redis is None:
+        app.state.redis = MemoryStore.from_env()
+        app.state.redis.start_snapshots()
+        if redis_url == "memory://":
+            print("[INFO] Using the embedded memory store (REDIS_URL=memory://)")
+        elif app.state.redis.snapshot_path:
+            print(f"[WARNING] Redis unavailable. Using in-memory storage (snapshotted to {app.state.redis.snapshot_path}).")
+        else:
+            print("[WARNING] Redis unavailable. Using in-memory storage (data will be lost on restart).")
+
+    # Shared provider connection pools
+    app.state.clients = ProviderClients()
+    
+    # Models are built on first use, except the declared warm ones
+    app.state.registry = ModelRegistry.from_env(app.state.clients)
+    models.update(app.state.registry.proxies())
+    await app.state.registry.warm_up()
+    
+    # Per-model concurrency limits with fair, bounded wait queues
+    app.state.admission = AdmissionController.from_env(models)
+    models.update({name: app.state.admission.wrap(name, model) for name, model in models.items()})
+    
+    # Latency-aware routing for model "auto"
+    app.state.router = ModelRouter.from_env(models)
+    
+    # Cache and history writes are batched off the response path
+    app.state.write_behind = WriteBehindQueue.from_env(app.state.redis)
+    app.state.write_behind.start()
+    
+    # Per-API-key usage counters, flushed to Redis in batches; daily token quotas
+    app.state.metering = UsageMeter.from_env(app.state.redis)
+    app.state.metering.start()
+    
+    # Stored history format, and compression of large cached responses and history messages
+    app.state.codec = Codec.from_env()
+    app.state.compressor = Compressor.from_env()
+    
+    # Two-tier response cache (in-process LRU in front of Redis)
+    app.state.response_cache = ResponseCache.from_env(
+        app.state.redis, writer=app.state.write_behind, compressor=app.state.compressor
+    )
+    
+    # Coalesces identical in-flight generations (optionally across workers)
+    app.state.single_flight = SingleFlight.from_env(app.state.redis)
+    
+    # Optional semantic cache tier (SEMANTIC_CACHE_ENABLED)
+    app.state.semantic_cache = SemanticCache.from_env(
+        app.state.redis, app.state.clients.ollama, writer=app.state.write_behind
+    )
+    if app.state.semantic_cache:
+        await app.state.semantic_cache.load()
+    
+    # Token-budgeted conversation context with rolling summaries
+    app.state.context = ContextBuilder.from_env(
+        app.state.redis, writer=app.state.write_behind, compressor=app.state.compressor, codec=app.state.codec
+    )
+    if app.state.context.summary_model not in models:
+        print(f"[WARNING] SUMMARY_MODEL {app.state.context.summary_model} is not available; conversations will not be summarized.")
+    
+    # Gauges on /metrics are read from app.state at scrape time
+    metrics.state_collector.bind(app.state)
 
     yield
     # Shutdown
+    await app.state.context.close()
+    await app.state.registry.close()
+    models.clear()
+    await app.state.write_behind.stop()
+    await app.state.metering.stop()
+    await app.state.clients.close()
     await app.state.redis.close()
     if redis_pool:
         await redis_pool.disconnect()
     print("[INFO] Server shut down")
 
-app = FastAPI(title="AI Copilot Agent", lifespan=lifespan)
+# orjson renders responses several times faster than the standard JSON encoder
+app = FastAPI(
+    title="AI Copilot Agent",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
 # CORS middleware
 app.add_middleware(
@@ -123,79 +161,102 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
-# Rate limiting configuration
-RATE_LIMIT = int(os.getenv("RATE_LIMIT", "60"))  # requests per minute
-RATE_LIMIT_WINDOW = 60  # seconds
+# Rate limiting configuration (RATE_LIMIT requests per RATE_LIMIT_WINDOW seconds)
+rate_limiter = RateLimiter.from_env()
 
 # Conversation memory (stored in Redis)
-async def get_conversation_history(session_id: str, max_messages: int = 10) -> List[Dict]:
-    """Retrieve conversation history from Redis"""
-    redis_client = app.state.redis
-    key = f"conversation:{session_id}"
-    
-    # Get last N messages
-    messages = await redis_client.lrange(key, -max_messages * 2, -1)
-    
-    # Parse messages
+def parse_history(messages: List[str]) -> List[Dict]:
+    """Parse stored conversation messages, skipping malformed entries"""
     history = []
     for msg in messages:
         try:
-            history.append(json.loads(msg))
-        except:
+            message = Codec.decode(Compressor.decode(msg))
+        except (ValueError, TypeError):
             continue
+        # Legacy or foreign values that are not messages would break clients rendering them
+        if not isinstance(message, dict) or "role" not in message or "content" not in message:
+            continue
+        # Entries written before timestamps were stored as epoch seconds
+        if isinstance(message.get("timestamp"), str):
+            try:
+                message["timestamp"] = datetime.fromisoformat(message["timestamp"]).timestamp()
+            except ValueError:
+                # Keep the message, just without its unreadable timestamp
+                del message["timestamp"]
+        history.append(message)
     
     return history
 
 async def add_to_conversation(session_id: str, role: str, content: str):
-    """Add a message to conversation history"""
-    redis_client = app.state.redis
+    """Add a message to conversation history (queued for write-behind)"""
+    writer = app.state.write_behind
     key = f"conversation:{session_id}"
     
     message = {
         "role": role,
         "content": content,
-        "timestamp": datetime.now().isoformat()
+        "tokens": estimate_tokens(content),  # Cached for context packing
+        "timestamp": round(time.time(), 3)
     }
     
-    await redis_client.rpush(key, json.dumps(message))
-    await redis_client.expire(key, 86400)  # Expire after 24 hours
+    await writer.rpush(key, app.state.compressor.encode(app.state.codec.encode(message)))
+    await writer.expire(key, 86400)  # Expire after 24 hours
 
 # Cache middleware
-async def get_cached_response(prompt: str, model: str) -> Optional[str]:
-    """Get cached response if available"""
-    redis_client = app.state.redis
-    cache_key = f"cache:{model}:{hashlib.md5(prompt.encode()).hexdigest()}"
-    
-    cached = await redis_client.get(cache_key)
-    return cached if cached else None
+def get_cache_key(prompt: str, model: str, copilot_type: str, history: List[Dict]) -> str:
+    """Build the cache key for a request, including its system prompt and history"""
+    system_prompt = SPECIALIZED_PROMPTS.get(copilot_type, SPECIALIZED_PROMPTS["general"])
+    return ResponseCache.key(prompt, model, copilot_type, system_prompt, history)
 
-async def cache_response(prompt: str, model: str, response: str, ttl: int = 3600):
-    """Cache a response"""
-    redis_client = app.state.redis
-    cache_key = f"cache:{model}:{hashlib.md5(prompt.encode()).hexdigest()}"
-    await redis_client.setex(cache_key, ttl, response)
+async def get_cached_response(cache_key: str, copilot_type: str) -> Optional[str]:
+    """Get cached response if available (in-process L1, then Redis)"""
+    return await app.state.response_cache.get(cache_key, copilot_type)
 
-# Rate limiting middleware
-async def check_rate_limit(client_ip: str) -> bool:
-    """Check if client has exceeded rate limit"""
-    redis_client = app.state.redis
-    key = f"rate_limit:{client_ip}"
-    
-    # Get current count
-    current = await redis_client.get(key)
-    
-    if current is None:
-        # First request in window
-        await redis_client.setex(key, RATE_LIMIT_WINDOW, 1)
-        return True
+async def cache_response(cache_key: str, copilot_type: str, response: str):
+    """Cache a response with the copilot type's TTL"""
+    await app.state.response_cache.set(cache_key, response, copilot_type)
+
+async def lookup_cache(prompt: str, model: str, copilot_type: str, history: List[Dict]) -> Dict:
+    """Look up a response in the exact cache, then the semantic tier if enabled.
+
+    Returns a dict with the exact ``key``, ``response`` (None on a miss), the
+    ``tier`` that hit and, for the semantic tier, the ``similarity`` and prompt
+    ``embedding``. The semantic tier is only consulted for prompts without history.
+    """
+    cache_key = get_cache_key(prompt, model, copilot_type, history)
+    cached = await get_cached_response(cache_key, copilot_type)
+    if cached:
+        return {"key": cache_key, "response": cached, "tier": "exact"}
     
-    current = int(current)
-    if current >= RATE_LIMIT:
-        return False
+    semantic_cache = app.state.semantic_cache
+    if not semantic_cache or history:
+        return {"key": cache_key, "response": None, "tier": None}
     
-    # Increment counter
-    await redis_client.incr(key)
-    return True
+    match = await semantic_cache.lookup(prompt, model, copilot_type)
+    response = await get_cached_response(match["key"], copilot_type) if match["key"] else None
+    if match["key"] and response is None:
+        # The matched response expired from the exact cache
+        semantic_cache.discard(match["key"], model, copilot_type)
+    return {
+        "key": cache_key,
+        "response": response,
+        "tier": "semantic" if response else None,
+        "similarity": match.get("similarity"),
+        "embedding": match["embedding"]
+    }
+
+async def remember_response(model: str, copilot_type: str, response: str, lookup: Dict):
+    """Cache a generated response and index it in the semantic tier"""
+    await cache_response(lookup["key"], copilot_type, response)
+    if app.state.semantic_cache and lookup.get("embedding") is not None:
+        await app.state.semantic_cache.add(lookup["key"], model, copilot_type, lookup["embedding"])
+
+def cache_info(lookup: Dict) -> Dict:
+    """Cache hit/miss fields reported in copilot responses"""
+    info = {"cached": lookup["response"] is not None, "cache_tier": lookup["tier"]}
+    if lookup.get("similarity"):
+        info["similarity"] = round(lookup["similarity"], 4)
+    return info
 
 # Authentication
 API_KEYS = {
@@ -209,12 +270,16 @@ async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(sec
         raise HTTPException(status_code=403, detail="Invalid API key")
     return API_KEYS[api_key]
 
-# AI Models initialization
-models = {
-    "gpt4": OpenAIModel(model="gpt-4o"),
-    "gpt35": OpenAIModel(model="gpt-3.5-turbo"),
-    "claude": ClaudeModel(model="claude-opus-4-6"),
-    "local": LocalModel(model_path=os.getenv("LOCAL_MODEL_PATH", "./models/local")),
+# AI Models initialization (populated in lifespan once the provider clients exist)
+models = {}
+
+# Model choice that lets the router pick a backend
+AUTO_MODEL = "auto"
+
+# Disable proxy buffering so tokens reach the client as soon as they are produced
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
 }
 
 # Specialized copilot prompts
@@ -236,101 +301,519 @@ SPECIALIZED_PROMPTS = {
 @app.post("/copilot")
 async def general_copilot(
     request: Request,
+    response: Response,
     auth_user: str = Depends(verify_api_key)
 ):
     """General programming copilot"""
-    return await process_request(request, "general")
+    return await process_request(request, "general", auth_user, response)
 
 @app.post("/copilot/python")
 async def python_copilot(
     request: Request,
+    response: Response,
     auth_user: str = Depends(verify_api_key)
 ):
     """Python specialist copilot"""
-    return await process_request(request, "python")
+    return await process_request(request, "python", auth_user, response)
 
 @app.post("/copilot/javascript")
 async def javascript_copilot(
     request: Request,
+    response: Response,
     auth_user: str = Depends(verify_api_key)
 ):
     """JavaScript specialist copilot"""
-    return await process_request(request, "javascript")
+    return await process_request(request, "javascript", auth_user, response)
 
 @app.post("/copilot/debug")
 async def debug_copilot(
     request: Request,
+    response: Response,
     auth_user: str = Depends(verify_api_key)
 ):
     """Debugging specialist copilot"""
-    return await process_request(request, "debug")
+    return await process_request(request, "debug", auth_user, response)
 
-async def process_request(request: Request, copilot_type: str):
-    """Process incoming requests with all enhancements"""
+# Streaming (Server-Sent Events) endpoints
+@app.post("/copilot/stream")
+async def general_copilot_stream(
+    request: Request,
+    auth_user: str = Depends(verify_api_key)
+):
+    """General programming copilot (streaming)"""
+    return await process_stream_request(request, "general", auth_user)
+
+@app.post("/copilot/python/stream")
+async def python_copilot_stream(
+    request: Request,
+    auth_user: str = Depends(verify_api_key)
+):
+    """Python specialist copilot (streaming)"""
+    return await process_stream_request(request, "python", auth_user)
+
+@app.post("/copilot/javascript/stream")
+async def javascript_copilot_stream(
+    request: Request,
+    auth_user: str = Depends(verify_api_key)
+):
+    """JavaScript specialist copilot (streaming)"""
+    return await process_stream_request(request, "javascript", auth_user)
+
+@app.post("/copilot/debug/stream")
+async def debug_copilot_stream(
+    request: Request,
+    auth_user: str = Depends(verify_api_key)
+):
+    """Debugging specialist copilot (streaming)"""
+    return await process_stream_request(request, "debug", auth_user)
+
+@app.post("/copilot/batch")
+async def batch_copilot(
+    request: Request,
+    auth_user: str = Depends(verify_api_key)
+):
+    """Answer many independent prompts in one call (NDJSON, in completion order)"""
+    return await process_batch_request(request, auth_user)
+
+async def read_request_state(client_ip: str, auth_user: str, session_id: str):
+    """Rate limit check and conversation state fetch in a single pipelined round-trip"""
+    context = app.state.context
+    
+    with metrics.stage("request_state"):
+        # Make sure this session's queued writes are visible
+        await app.state.write_behind.sync(context.conversation_key(session_id))
+        await app.state.write_behind.sync(context.summary_key(session_id))
+        
+        pipe = app.state.redis.pipeline(transaction=False)
+        await rate_limiter.queue(pipe, client_ip, auth_user)
+        context.queue_read(pipe, session_id)
+        raw_rate_limit, length, messages, summary = await pipe.execute()
+    
+    return rate_limiter.result(raw_rate_limit, auth_user), context.parse(length, messages, summary)
+
+async def parse_copilot_request(request: Request, auth_user: str) -> Dict:
+    """Parse the copilot request body, apply rate limiting and load the conversation state"""
     
     # Get client IP for rate limiting
     client_ip = request.client.host
     
-    # Check rate limit
-    if not await check_rate_limit(client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.")
-    
     # Parse request body
     body = await request.json()
     user_prompt = body.get("prompt")
     session_id = body.get("session_id", client_ip)  # Use client IP as default session
-    model_choice = body.get("model", "gpt4")  # Default to GPT-4
+    
+    # Check rate limit and get conversation state together
+    rate_limit, conversation = await read_request_state(client_ip, auth_user, session_id)
+    headers = rate_limit_headers(rate_limit)
+    if not rate_limit["allowed"]:
+        # The body's model is unchecked here, so it is not used as a metric label
+        metrics.record_error("copilot", "rate_limited")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=headers)
     
     if not user_prompt:
         raise HTTPException(status_code=400, detail="No prompt provided")
     
+    # Checked before the model name is used in cache keys, metric labels or usage counters
+    model_choice = body.get("model", "gpt4")  # Default to GPT-4
+    if model_choice != AUTO_MODEL and model_choice not in models:
+        raise HTTPException(status_code=400, detail=f"Invalid model choice: {model_choice}")
+    
+    return {
+        "prompt": user_prompt,
+        "session_id": session_id,
+        "model": model_choice,
+        "conversation": conversation,
+        "headers": headers,
+    }
+
+def select_model(model_choice: str, copilot_type: str):
+    """Look up the AI model for a model choice ("auto" routes to the fastest healthy model)"""
+    if model_choice == AUTO_MODEL:
+        return RoutedModel(app.state.router, copilot_type)
+    model = models.get(model_choice)
+    if not model:
+        raise HTTPException(status_code=400, detail=f"Invalid model choice: {model_choice}")
+    return model
+
+def served_model(model, model_choice: str) -> str:
+    """Name of the backend that answered (the routed model for "auto")"""
+    return getattr(model, "served_by", None) or model_choice
+
+def route_info(model) -> Dict:
+    """Which model answered an "auto" request (left out when it is not known)"""
+    return {"routed_model": model.served_by} if isinstance(model, RoutedModel) and model.served_by else {}
+
+def overloaded(error: AdmissionRejected, headers: Dict) -> HTTPException:
+    """503 telling the client when the saturated model is likely to have room"""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={**headers, "Retry-After": str(error.retry_after)}
+    )
+
+def quota_exceeded(error: QuotaExceeded, headers: Dict) -> HTTPException:
+    """429 telling the client when its daily token quota resets"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={**headers, "Retry-After": str(error.retry_after)}
+    )
+
+def build_context(params: Dict, system_prompt: str) -> List[Dict]:
+    """Conversation history to send with the prompt, packed into the model's token budget"""
+    return app.state.context.build(params["conversation"], params["model"], system_prompt, params["prompt"])
+
+async def store_history(session_id: str, user_prompt: str, response: str, conversation: Dict):
+    """Record a user/assistant exchange and summarize older turns when due"""
+    with metrics.stage("store_history"):
+        await add_to_conversation(session_id, "user", user_prompt)
+        await add_to_conversation(session_id, "assistant", response)
+    context = app.state.context
+    context.maybe_summarize(session_id, conversation, models.get(context.summary_model))
+
+async def generate_coalesced(
+    model,
+    model_choice: str,
+    copilot_type: str,
+    user_prompt: str,
+    system_prompt: str,
+    history: List[Dict],
+    lookup: Dict,
+    usage: Dict
+) -> str:
+    """Generate and cache a response; identical concurrent prompts share a single generation"""
+    
+    async def generate() -> Dict:
+        started = time.perf_counter()
+        response = await model.generate_response(
+            user_prompt=user_prompt,
+            system_prompt=system_prompt,
+            conversation_history=history,
+            usage=usage
+        )
+        elapsed = time.perf_counter() - started
+        metrics.observe_stage("generate", elapsed)
+        metrics.observe_model(served_model(model, model_choice), elapsed)
+        metrics.record_usage(served_model(model, model_choice), usage)
+        await remember_response(model_choice, copilot_type, response, lookup)
+        if app.state.single_flight.redis is not None:
+            # Coalesced waiters in other workers poll Redis for the result
+            await app.state.write_behind.sync(lookup["key"])
+        return {"response": response, "served_by": getattr(model, "served_by", None)}
+    
+    async def fetch() -> Optional[Dict]:
+        # Generated by another worker: which model answered is not known here
+        response = await get_cached_response(lookup["key"], copilot_type)
+        return {"response": response, "served_by": None} if response else None
+    
+    result = await app.state.single_flight.do(lookup["key"], generate, fetch=fetch)
+    if isinstance(model, RoutedModel) and model.served_by is None:
+        # Joined another request's generation: report the model that ran it
+        model.served_by = result["served_by"]
+    return result["response"]
+
+@metrics.timed("copilot")
+async def process_request(request: Request, copilot_type: str, auth_user: str, http_response: Response):
+    """Process incoming requests with all enhancements"""
+    
+    params = await parse_copilot_request(request, auth_user)
+    http_response.headers.update(params["headers"])
+    current_tenant.set(auth_user)
+    user_prompt = params["prompt"]
+    session_id = params["session_id"]
+    model_choice = params["model"]
+    
+    # Get specialized prompt
+    system_prompt = SPECIALIZED_PROMPTS.get(copilot_type, SPECIALIZED_PROMPTS["general"])
+    
+    # Conversation context (part of the cache key)
+    history = build_context(params, system_prompt)
+    
+    # Select AI model before anything is counted against the model choice
+    model = select_model(model_choice, copilot_type)
+    
     # Check cache first
-    cached_response = await get_cached_response(user_prompt, model_choice)
-    if cached_response:
+    with metrics.stage("cache_lookup"):
+        lookup = await lookup_cache(user_prompt, model_choice, copilot_type, history)
+    metrics.record_cache(model_choice, copilot_type, lookup["tier"])
+    metering = app.state.metering
+    metering.record(auth_user, model_choice, requests=1, cache_hits=int(lookup["response"] is not None))
+    if lookup["response"]:
         return {
-            "response": cached_response,
-            "cached": True,
+            "response": lookup["response"],
+            **cache_info(lookup),
             "model": model_choice,
             "copilot_type": copilot_type
         }
     
-    # Get conversation history
-    history = await get_conversation_history(session_id)
+    try:
+        metering.check(auth_user)
+    except QuotaExceeded as e:
+        metrics.record_error(model_choice, "quota_exceeded")
+        raise quota_exceeded(e, params["headers"])
     
-    # Get specialized prompt
-    system_prompt = SPECIALIZED_PROMPTS.get(copilot_type, SPECIALIZED_PROMPTS["general"])
-    
-    # Select and use AI model
-    model = models.get(model_choice)
-    if not model:
-        raise HTTPException(status_code=400, detail=f"Invalid model choice: {model_choice}")
+    # Token counts (including provider prompt cache reads/writes) of this request's generation
+    usage = {}
     
     try:
-        # Generate response
-        response = await model.generate_response(
-            user_prompt=user_prompt,
-            system_prompt=system_prompt,
-            conversation_history=history
+        response = await generate_coalesced(
+            model, model_choice, copilot_type, user_prompt, system_prompt, history, lookup, usage
         )
+        metering.record(auth_user, served_model(model, model_choice), usage=usage)
         
-        # Cache the response
-        await cache_response(user_prompt, model_choice, response)
-        
-        # Store in conversation history
-        await add_to_conversation(session_id, "user", user_prompt)
-        await add_to_conversation(session_id, "assistant", response)
+        await store_history(session_id, user_prompt, response, params["conversation"])
         
+        # Requests that joined another request's generation report no usage
         return {
             "response": response,
-            "cached": False,
+            **cache_info(lookup),
             "model": model_choice,
             "copilot_type": copilot_type,
-            "session_id": session_id
+            "session_id": session_id,
+            "usage": usage or None,
+            **route_info(model)
         }
         
+    except AdmissionRejected as e:
+        metrics.record_error(model_choice, "overloaded")
+        raise overloaded(e, params["headers"])
     except Exception as e:
+        metrics.record_error(model_choice, "model_error")
         raise HTTPException(status_code=500, detail=f"AI model error: {str(e)}")
 
+# Batch limits: items per request and generations run at once per request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+def parse_batch_item(index: int, item) -> Dict:
+    """Validate one batch item; invalid items carry an ``error`` instead of failing the batch"""
+    if not isinstance(item, dict):
+        return {"index": index, "error": "Invalid item"}
+    copilot_type = item.get("copilot_type", "general")
+    model_choice = item.get("model", "gpt4")
+    if not item.get("prompt"):
+        return {"index": index, "id": item.get("id"), "error": "No prompt provided"}
+    if copilot_type not in SPECIALIZED_PROMPTS:
+        return {"index": index, "id": item.get("id"), "error": f"Invalid copilot type: {copilot_type}"}
+    if model_choice != AUTO_MODEL and model_choice not in models:
+        return {"index": index, "id": item.get("id"), "error": f"Invalid model choice: {model_choice}"}
+    return {
+        "index": index,
+        "id": item.get("id"),
+        "prompt": item["prompt"],
+        "copilot_type": copilot_type,
+        "model": model_choice,
+        "key": get_cache_key(item["prompt"], model_choice, copilot_type, [])
+    }
+
+async def process_batch_request(request: Request, auth_user: str):
+    """Process a batch of independent prompts, streaming NDJSON results as they complete.
+
+    Items are stateless (no conversation history). The whole batch is rate limited
+    once with a cost of one per item, cached answers are found with one bulk
+    lookup and returned first, and the misses are generated with at most
+    ``BATCH_CONCURRENCY`` running at once. Duplicate prompts are generated once.
+    """
+    
+    client_ip = request.client.host
+    body = await request.json()
+    raw_items = body.get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {BATCH_MAX_ITEMS})")
+    # Each item costs one request; a batch costing more than the whole limit could never be allowed
+    max_cost = rate_limiter.max_cost(auth_user)
+    if len(raw_items) > max_cost:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items: a batch costs one request per item and the rate limit is {max_cost} requests"
+        )
+    
+    rate_limit = await rate_limiter.check(app.state.redis, client_ip, auth_user, cost=len(raw_items))
+    headers = rate_limit_headers(rate_limit)
+    if not rate_limit["allowed"]:
+        metrics.record_error("batch", "rate_limited")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Try again later.", headers=headers)
+    current_tenant.set(auth_user)
+    started = time.perf_counter()
+    
+    items = [parse_batch_item(index, item) for index, item in enumerate(raw_items)]
+    valid = [item for item in items if "error" not in item]
+    
+    # One bulk cache lookup for the whole batch
+    with metrics.stage("cache_lookup"):
+        cached = await app.state.response_cache.get_many(
+            [item["key"] for item in valid], [item["copilot_type"] for item in valid]
+        )
+    
+    # Cache misses, deduplicated by cache key
+    metering = app.state.metering
+    misses: Dict[str, List[Dict]] = {}
+    for item, response in zip(valid, cached):
+        item["response"] = response
+        metrics.record_cache(item["model"], item["copilot_type"], "exact" if response is not None else None)
+        metering.record(auth_user, item["model"], requests=1, cache_hits=int(response is not None))
+        if response is None:
+            misses.setdefault(item["key"], []).append(item)
+    
+    def result_line(item: Dict, **fields) -> str:
+        return json_dumps({
+            "index": item["index"],
+            "id": item.get("id"),
+            "model": item.get("model"),
+            "copilot_type": item.get("copilot_type"),
+            **fields
+        }) + "\n"
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run(group: List[Dict]) -> List[str]:
+        item = group[0]
+        lookup = {"key": item["key"], "response": None, "tier": None}
+        model = select_model(item["model"], item["copilot_type"])
+        usage = {}
+        async with semaphore:
+            try:
+                # Checked per generation: earlier items of the batch may use up the quota
+                metering.check(auth_user)
+                response = await generate_coalesced(
+                    model, item["model"], item["copilot_type"], item["prompt"],
+                    SPECIALIZED_PROMPTS[item["copilot_type"]], [], lookup, usage
+                )
+                metering.record(auth_user, served_model(model, item["model"]), usage=usage)
+            except QuotaExceeded as e:
+                metrics.record_error(item["model"], "quota_exceeded")
+                return [result_line(each, error=str(e), retry_after=e.retry_after) for each in group]
+            except AdmissionRejected as e:
+                metrics.record_error(item["model"], "overloaded")
+                return [result_line(each, error=str(e), retry_after=e.retry_after) for each in group]
+            except Exception as e:
+                metrics.record_error(item["model"], "model_error")
+                return [result_line(each, error=f"AI model error: {str(e)}") for each in group]
+        # Duplicates share the one generation; only its line reports the usage
+        results = [result_line(item, response=response, **cache_info(lookup), usage=usage or None, **route_info(model))]
+        results += [
+            result_line(each, response=response, cached=True, cache_tier="coalesced", usage=None, **route_info(model))
+            for each in group[1:]
+        ]
+        return results
+    
+    async def lines() -> AsyncIterator[str]:
+        for item in items:
+            if "error" in item:
+                yield json_dumps(item) + "\n"
+            elif item["response"] is not None:
+                yield result_line(item, response=item["response"], cached=True, cache_tier="exact")
+        
+        tasks = [asyncio.create_task(run(group)) for group in misses.values()]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for line in await finished:
+                    yield line
+        finally:
+            # Client went away: stop generating
+            for task in tasks:
+                task.cancel()
+            metrics.REQUEST_SECONDS.labels("batch").observe(time.perf_counter() - started)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+async def process_stream_request(request: Request, copilot_type: str, auth_user: str):
+    """Process a copilot request, streaming the response as Server-Sent Events.
+
+    Emits ``token`` events carrying text chunks as the model produces them, then a
+    single ``done`` event with the response metadata (or an ``error`` event). The
+    assembled text is cached and added to the conversation history only once the
+    stream has completed successfully.
+    """
+    
+    request_started = time.perf_counter()
+    params = await parse_copilot_request(request, auth_user)
+    user_prompt = params["prompt"]
+    session_id = params["session_id"]
+    model_choice = params["model"]
+    headers = {**SSE_HEADERS, **params["headers"]}
+    
+    metadata = {
+        "model": model_choice,
+        "copilot_type": copilot_type,
+        "session_id": session_id
+    }
+    
+    # Get specialized prompt
+    system_prompt = SPECIALIZED_PROMPTS.get(copilot_type, SPECIALIZED_PROMPTS["general"])
+    
+    # Conversation context (part of the cache key)
+    history = build_context(params, system_prompt)
+    
+    # Select AI model before anything is counted against the model choice
+    model = select_model(model_choice, copilot_type)
+    
+    # Check cache first
+    with metrics.stage("cache_lookup"):
+        lookup = await lookup_cache(user_prompt, model_choice, copilot_type, history)
+    metrics.record_cache(model_choice, copilot_type, lookup["tier"])
+    metering = app.state.metering
+    metering.record(auth_user, model_choice, requests=1, cache_hits=int(lookup["response"] is not None))
+    if lookup["response"]:
+        async def cached_events() -> AsyncIterator[str]:
+            yield sse_event("token", {"token": lookup["response"]})
+            yield sse_event("done", {**metadata, **cache_info(lookup)})
+        
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+    
+    # Quota and saturated models fail before the stream starts
+    try:
+        metering.check(auth_user)
+    except QuotaExceeded as e:
+        metrics.record_error(model_choice, "quota_exceeded")
+        raise quota_exceeded(e, params["headers"])
+    current_tenant.set(auth_user)
+    gate = app.state.admission.gate(model_choice) if model_choice in models else None
+    if gate and gate.full():
+        metrics.record_error(model_choice, "overloaded")
+        raise overloaded(AdmissionRejected(model_choice, gate.retry_after()), params["headers"])
+    
+    async def events() -> AsyncIterator[str]:
+        chunks = []
+        usage = {}
+        started = time.perf_counter()
+        try:
+            async for chunk in model.stream_response(
+                user_prompt=user_prompt,
+                system_prompt=system_prompt,
+                conversation_history=history,
+                usage=usage
+            ):
+                if not chunks:
+                    metrics.observe_stage("first_token", time.perf_counter() - started)
+                chunks.append(chunk)
+                yield sse_event("token", {"token": chunk})
+        except Exception as e:
+            metrics.record_error(model_choice, "overloaded" if isinstance(e, AdmissionRejected) else "model_error")
+            yield sse_event("error", {"detail": f"AI model error: {str(e)}"})
+            return
+        
+        elapsed = time.perf_counter() - started
+        metrics.observe_stage("generate", elapsed)
+        metrics.observe_model(served_model(model, model_choice), elapsed)
+        metrics.record_usage(served_model(model, model_choice), usage)
+        metering.record(auth_user, served_model(model, model_choice), usage=usage)
+        
+        # Only complete streams are cached and stored
+        response = "".join(chunks)
+        await remember_response(model_choice, copilot_type, response, lookup)
+        await store_history(session_id, user_prompt, response, params["conversation"])
+        metrics.REQUEST_SECONDS.labels("stream").observe(time.perf_counter() - request_started)
+        yield sse_event("done", {**metadata, **cache_info(lookup), "usage": usage or None, **route_info(model)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -338,22 +821,75 @@ async def health_check():
     redis_client = app.state.redis
     redis_status = "connected" if await redis_client.ping() else "disconnected"
     
+    semantic_cache = app.state.semantic_cache
+    
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "redis": redis_status,
-        "models_available": list(models.keys())
+        "models_available": list(models.keys()),
+        "models": app.state.registry.stats(),
+        "ollama_hosts": app.state.registry.ollama_pool.stats() if app.state.registry.ollama_pool else None,
+        "response_cache": app.state.response_cache.stats(),
+        "compression": app.state.compressor.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else "disabled",
+        "router": app.state.router.stats(),
+        "admission": app.state.admission.stats(),
+        "metering": app.state.metering.stats()
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (per-stage latency, cache hit ratios, token usage, errors)"""
+    # Set as a header: media_type would get a second charset appended
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE_LATEST})
+
 # Get conversation history endpoint
 @app.get("/history/{session_id}")
 async def get_history(
     session_id: str,
+    limit: int = 100,
+    offset: int = 0,
+    auth_user: str = Depends(verify_api_key)
+):
+    """Get conversation history for a session, paging back from the newest message.
+
+    Returns up to ``limit`` messages (oldest first) that precede the newest
+    ``offset`` messages, plus the ``total`` number stored, so clients can load
+    older pages of a long conversation.
+    """
+    if limit < 1 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be positive and offset non-negative")
+    key = f"conversation:{session_id}"
+    # Make sure this session's queued writes are visible
+    await app.state.write_behind.sync(key)
+    
+    pipe = app.state.redis.pipeline(transaction=False)
+    pipe.llen(key)
+    pipe.lrange(key, -(offset + limit), -(offset + 1))
+    total, messages = await pipe.execute()
+    if offset >= total:
+        messages = []
+    return {"session_id": session_id, "history": parse_history(messages), "total": total, "offset": offset}
+
+# Usage endpoint
+@app.get("/usage/{user}")
+async def get_usage(
+    user: str,
+    day: Optional[str] = None,
     auth_user: str = Depends(verify_api_key)
 ):
-    """Get conversation history for a session"""
-    history = await get_conversation_history(session_id, max_messages=50)
-    return {"session_id": session_id, "history": history}
+    """Requests, cache hits and tokens per model for the authenticated user on a UTC day (default today)"""
+    if user != auth_user:
+        raise HTTPException(status_code=403, detail="Usage of other users is not visible")
+    if day is not None:
+        try:
+            datetime.strptime(day, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+    usage = await app.state.metering.report(user, [*models, AUTO_MODEL], day)
+    return {"user": user, **usage}
 
 # Clear history endpoint
 @app.delete("/history/{session_id}")
@@ -364,7 +900,11 @@ async def clear_history(
     """Clear conversation history for a session"""
     redis_client = app.state.redis
     key = f"conversation:{session_id}"
-    await redis_client.delete(key)
+    summary_key = app.state.context.summary_key(session_id)
+    # Flush queued writes first so they cannot recreate the list afterwards
+    await app.state.write_behind.sync(key)
+    await app.state.write_behind.sync(summary_key)
+    await redis_client.delete(key, summary_key)
     return {"message": f"History cleared for session {session_id}"}
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Expired keys reclaimed per write, so purging stays O(1) amortized
+PURGE_BATCH = 32
+
+def _sizeof(key: str, value: Any) -> int:
+    """Approximate memory footprint of an entry in bytes"""
+    if isinstance(value, list):
+        return len(key) + sum(len(item) for item in value) + 8 * len(value)
+    return len(key) + len(value if isinstance(value, str) else str(value))
+
+class MemoryPipeline:
+    """Queues store commands and runs them back to back on execute()"""
+
+    def __init__(self, store: "MemoryStore"):
+        self.store = store
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        # Store commands never yield, so the batch runs without interleaving
+        commands, self.commands = self.commands, []
+        return [await getattr(self.store, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+class MemoryStore:
+    """Embedded Redis stand-in for deployments without Redis.
+
+    - Expiry is lazy: a key is checked when touched, and a min-heap of deadlines
+      lets each write reclaim a few expired keys without scanning the keyspace.
+      The heap is compacted when superseded deadlines outnumber live ones.
+    - Memory is bounded by ``max_bytes`` (approximate); least recently used keys
+      are evicted first.
+    - Supports the pipelines and scripts used by the Redis code path.
+    - With ``snapshot_path`` the keyspace is written to disk every
+      ``snapshot_interval`` seconds and on close, and reloaded on startup.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: float = 60.0
+    ):
+        self.max_bytes = max_bytes
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.data: "OrderedDict[str, Any]" = OrderedDict()
+        self.expiries: Dict[str, float] = {}
+        self.size = 0
+        self._sizes: Dict[str, int] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._snapshot_task = None
+        if snapshot_path:
+            self._load_snapshot()
+
+    @classmethod
+    def from_env(cls) -> "MemoryStore":
+        """Build from MEMORY_STORE_MAX_BYTES / MEMORY_STORE_SNAPSHOT_PATH / MEMORY_STORE_SNAPSHOT_INTERVAL"""
+        return cls(
+            max_bytes=int(os.getenv("MEMORY_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+            snapshot_path=os.getenv("MEMORY_STORE_SNAPSHOT_PATH") or None,
+            snapshot_interval=float(os.getenv("MEMORY_STORE_SNAPSHOT_INTERVAL", "60"))
+        )
+
+    # Synchronous core, also used by scripts
+
+    def _alive(self, key: str) -> bool:
+        deadline = self.expiries.get(key)
+        if deadline is not None and deadline <= time.time():
+            self._remove(key)
+            return False
+        return key in self.data
+
+    def _remove(self, key: str):
+        if key in self.data:
+            del self.data[key]
+            self.size -= self._sizes.pop(key, 0)
+        self.expiries.pop(key, None)
+
+    def _store(self, key: str, value: Any):
+        """Write a value, keeping the memory accounting and LRU order up to date"""
+        self.size -= self._sizes.get(key, 0)
+        self.data[key] = value
+        self.data.move_to_end(key)
+        self._sizes[key] = _sizeof(key, value)
+        self.size += self._sizes[key]
+        self._purge_expired()
+        self._evict()
+
+    def _set_expiry(self, key: str, seconds: float):
+        deadline = time.time() + seconds
+        self.expiries[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        # Refreshed TTLs leave stale entries behind; rebuild once they outnumber the live deadlines
+        if len(self._heap) > 2 * len(self.expiries) + PURGE_BATCH:
+            self._heap = [(deadline, key) for key, deadline in self.expiries.items()]
+            heapq.heapify(self._heap)
+
+    def _purge_expired(self):
+        now = time.time()
+        for _ in range(PURGE_BATCH):
+            if not self._heap or self._heap[0][0] > now:
+                return
+            deadline, key = heapq.heappop(self._heap)
+            # Skip stale heap entries left behind by a later expire/persist
+            if self.expiries.get(key) == deadline:
+                self._remove(key)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.data) > 1:
+            key = next(iter(self.data))
+            self._remove(key)
+
+    def sync_get(self, key: str):
+        if not self._alive(key):
+            return None
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def sync_set(self, key: str, value, nx: bool = False, px: Optional[int] = None, ex: Optional[float] = None):
+        if nx and self._alive(key):
+            return None
+        self._store(key, value)
+        if px is not None:
+            self._set_expiry(key, px / 1000)
+        elif ex is not None:
+            self._set_expiry(key, ex)
+        else:
+            self.expiries.pop(key, None)
+        return True
+
+    def sync_delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                self._remove(key)
+                deleted += 1
+        return deleted
+
+    # Redis-compatible async API
+
+    async def get(self, key):
+        return self.sync_get(key)
+
+    async def mget(self, keys):
+        return [self.sync_get(key) for key in keys]
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        return self.sync_set(key, value, nx=nx, px=px, ex=ex)
+
+    async def setex(self, key, time, value):
+        return self.sync_set(key, value, ex=time)
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def incrby(self, key, amount):
+        value = int(self.sync_get(key) or 0) + amount
+        self._store(key, str(value))
+        return value
+
+    async def lrange(self, key, start, end):
+        lst = self.sync_get(key)
+        if not isinstance(lst, list):
+            return []
+        if end == -1:
+            return lst[start:]
+        return lst[start:end+1]
+
+    async def llen(self, key):
+        lst = self.sync_get(key)
+        return len(lst) if isinstance(lst, list) else 0
+
+    async def rpush(self, key, value):
+        lst = self.sync_get(key)
+        if not isinstance(lst, list):
+            self._store(key, [value])
+            return 1
+        # Grow the accounting incrementally instead of re-measuring the whole list
+        lst.append(value)
+        delta = len(value) + 8
+        self._sizes[key] += delta
+        self.size += delta
+        self._purge_expired()
+        self._evict()
+        return len(lst)
+
+    async def ltrim(self, key, start, end):
+        lst = self.sync_get(key)
+        if isinstance(lst, list):
+            self._store(key, lst[start:] if end == -1 else lst[start:end+1])
+        return True
+
+    async def expire(self, key, time):
+        if self._alive(key):
+            self._set_expiry(key, time)
+            return True
+        return False
+
+    async def delete(self, *keys):
+        return self.sync_delete(*keys)
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+    async def run_script(self, script, keys, args):
+        # Runs without awaiting, so it is atomic like a Lua script on Redis
+        return script.local(self, keys, args)
+
+    async def ping(self):
+        return True
+
+    async def close(self):
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self.snapshot_path:
+            await self.snapshot()
+
+    # Snapshots
+
+    def start_snapshots(self):
+        """Start periodic snapshotting (requires a running event loop)"""
+        if self.snapshot_path and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                print(f"[WARNING] Memory store snapshot failed: {e}")
+
+    async def snapshot(self):
+        """Write the keyspace to ``snapshot_path`` atomically"""
+        now = time.time()
+        # Copy on the event loop (lists are mutable), serialize in a thread
+        entries = [
+            [key, list(value) if isinstance(value, list) else value, self.expiries.get(key)]
+            for key, value in self.data.items()
+            if self.expiries.get(key, now + 1) > now
+        ]
+        await asyncio.to_thread(self._write_snapshot, entries)
+
+    def _write_snapshot(self, entries):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Could not load memory store snapshot: {e}")
+            return
+
+        now = time.time()
+        for key, value, deadline in entries:
+            if deadline is not None and deadline <= now:
+                continue
+            self._store(key, value)
+            if deadline is not None:
+                self.expiries[key] = deadline
+                heapq.heappush(self._heap, (deadline, key))
+        print(f"[INFO] Restored {len(self.data)} keys from {self.snapshot_path}")
@@ -0,0 +1,226 @@
+import asyncio
+import math
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Counters kept per user (the name an API key authenticates as), model and UTC day
+FIELDS = ("requests", "cache_hits", "input_tokens", "output_tokens")
+
+def utc_day(now: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+def seconds_until_tomorrow(now: Optional[float] = None) -> int:
+    """Seconds until quotas reset at midnight UTC"""
+    now = time.time() if now is None else now
+    return max(1, math.ceil(86400 - now % 86400))
+
+class QuotaExceeded(Exception):
+    """A user has used their daily token quota"""
+
+    def __init__(self, user: str, quota: int, retry_after: int):
+        super().__init__(f"Daily token quota of {quota} exhausted for {user}, resets in {retry_after}s")
+        self.user = user
+        self.quota = quota
+        self.retry_after = retry_after
+
+class UsageMeter:
+    """Per-user usage accounting without a Redis round-trip per request.
+
+    Requests, cache hits and prompt/completion tokens are added to in-process
+    counters and flushed every ``flush_interval`` seconds as one pipeline of
+    INCRBYs on ``usage:<user>:<day>:<model>:<field>`` keys, so every worker
+    adds to the same daily totals. Each flush also refreshes this worker's view
+    of the cluster-wide token total of the users it serves.
+
+    Daily token quotas (``quotas`` per user, else ``default_quota``; 0 means
+    unlimited) are checked against that view plus the tokens not flushed yet,
+    so enforcement costs a dict lookup. Other workers' usage is seen one flush
+    late, which lets a user overshoot their quota by at most a flush interval's
+    worth of generations.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        flush_interval: float = 5.0,
+        default_quota: int = 0,
+        quotas: Dict[str, int] = None,
+        retention_days: int = 35
+    ):
+        self.redis = redis_client
+        self.flush_interval = flush_interval
+        self.default_quota = default_quota
+        self.quotas = quotas or {}
+        self.retention = retention_days * 86400
+        self._pending: Dict[Tuple[str, str, str, str], int] = {}
+        self._pending_tokens: Dict[Tuple[str, str], int] = {}
+        self._flushing_tokens: Dict[Tuple[str, str], int] = {}
+        # (user, day) -> tokens used according to Redis at the last flush
+        self._used: Dict[Tuple[str, str], int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @classmethod
+    def from_env(cls, redis_client) -> "UsageMeter":
+        """Build from USAGE_FLUSH_INTERVAL / DAILY_TOKEN_QUOTA / TOKEN_QUOTAS / USAGE_RETENTION_DAYS"""
+        quotas = {}
+        for item in os.getenv("TOKEN_QUOTAS", "").split(","):
+            if ":" in item:
+                user, quota = item.split(":", 1)
+                quotas[user.strip()] = int(quota)
+        return cls(
+            redis_client,
+            flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "5")),
+            default_quota=int(os.getenv("DAILY_TOKEN_QUOTA", "0")),
+            quotas=quotas,
+            retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "35"))
+        )
+
+    @staticmethod
+    def key(user: str, day: str, model: str, field: str) -> str:
+        return f"usage:{user}:{day}:{model}:{field}"
+
+    @staticmethod
+    def total_key(user: str, day: str) -> str:
+        return f"usage:{user}:{day}:tokens"
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write out the remaining counts"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # Hot path: in-process counters only
+
+    def record(self, user: str, model: str, requests: int = 0, cache_hits: int = 0, usage: Optional[Dict] = None):
+        """Count a request (and whether the cache answered it) and the tokens a generation used"""
+        day = utc_day()
+        counts = {"requests": requests, "cache_hits": cache_hits}
+        if usage:
+            counts["input_tokens"] = usage.get("input_tokens") or 0
+            counts["output_tokens"] = usage.get("output_tokens") or 0
+        for field, amount in counts.items():
+            if amount:
+                key = (user, day, model, field)
+                self._pending[key] = self._pending.get(key, 0) + amount
+        tokens = counts.get("input_tokens", 0) + counts.get("output_tokens", 0)
+        if tokens:
+            self._pending_tokens[(user, day)] = self._pending_tokens.get((user, day), 0) + tokens
+        self._used.setdefault((user, day), 0)
+
+    def quota(self, user: str) -> int:
+        return self.quotas.get(user, self.default_quota)
+
+    def used(self, user: str, day: Optional[str] = None) -> int:
+        """Tokens ``user`` used on ``day`` as far as this worker knows"""
+        day = day or utc_day()
+        entry = (user, day)
+        return self._used.get(entry, 0) + self._flushing_tokens.get(entry, 0) + self._pending_tokens.get(entry, 0)
+
+    def check(self, user: str):
+        """Raise QuotaExceeded if ``user`` has no tokens left today"""
+        quota = self.quota(user)
+        if not quota:
+            return
+        # Tracked from now on, so the next flush loads the key's total
+        self._used.setdefault((user, utc_day()), 0)
+        if self.used(user) >= quota:
+            raise QuotaExceeded(user, quota, seconds_until_tomorrow())
+
+    # Background flushing
+
+    async def flush(self):
+        """Add the pending counts to Redis and refresh the token totals of the active keys"""
+        async with self._flush_lock:
+            today = utc_day()
+            # Yesterday's totals are no longer enforced
+            for user, day in [entry for entry in self._used if entry[1] != today]:
+                if (user, day) not in self._pending_tokens:
+                    del self._used[(user, day)]
+            if not self._pending and not self._used:
+                return
+
+            pending, self._pending = self._pending, {}
+            pending_tokens, self._pending_tokens = self._pending_tokens, {}
+            # Still counted by used() while the pipeline is in flight
+            self._flushing_tokens = pending_tokens
+            totals = list(self._used)
+            pipe = self.redis.pipeline(transaction=False)
+            for (user, day, model, field), amount in pending.items():
+                key = self.key(user, day, model, field)
+                pipe.incrby(key, amount)
+                pipe.expire(key, self.retention)
+            for user, day in totals:
+                key = self.total_key(user, day)
+                if pending_tokens.get((user, day)):
+                    pipe.incrby(key, pending_tokens[(user, day)])
+                    pipe.expire(key, self.retention)
+                else:
+                    pipe.get(key)
+            try:
+                results = await pipe.execute()
+            except Exception as e:
+                # Keep the counts; they are retried on the next flush
+                print(f"[WARNING] Usage flush failed ({len(pending)} counters pending): {e}")
+                self._merge(pending, pending_tokens)
+                return
+            finally:
+                self._flushing_tokens = {}
+
+            results = results[2 * len(pending):]
+            for user, day in totals:
+                self._used[(user, day)] = int(results[0] or 0)
+                results = results[2:] if pending_tokens.get((user, day)) else results[1:]
+
+    def _merge(self, pending: Dict, pending_tokens: Dict):
+        for key, amount in pending.items():
+            self._pending[key] = self._pending.get(key, 0) + amount
+        for key, amount in pending_tokens.items():
+            self._pending_tokens[key] = self._pending_tokens.get(key, 0) + amount
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Reporting
+
+    async def report(self, user: str, models: Iterable[str], day: Optional[str] = None) -> Dict:
+        """Usage of ``user`` per model on ``day`` (default today), read in one round-trip"""
+        day = day or utc_day()
+        await self.flush()
+        models = list(models)
+        values = await self.redis.mget(
+            [self.key(user, day, model, field) for model in models for field in FIELDS]
+            + [self.total_key(user, day)]
+        )
+        per_model = {}
+        for index, model in enumerate(models):
+            counts = {field: int(values[index * len(FIELDS) + offset] or 0) for offset, field in enumerate(FIELDS)}
+            if any(counts.values()):
+                per_model[model] = counts
+        used = int(values[-1] or 0)
+        quota = self.quota(user)
+        return {
+            "day": day,
+            "tokens_used": used,
+            "daily_token_quota": quota or None,
+            "tokens_remaining": max(0, quota - used) if quota else None,
+            "models": per_model
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "pending_counters": len(self._pending),
+            "active_keys": len(self._used),
+            "flush_interval": self.flush_interval
+        }
@@ -0,0 +1,146 @@
+import functools
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Dedicated registry so only the copilot metrics are exported (and tests can reload the app)
+REGISTRY = CollectorRegistry()
+
+# Stages of a copilot request, in order
+STAGES = (
+    "request_state",   # rate limit check + conversation fetch (one round-trip)
+    "cache_lookup",    # exact and semantic cache tiers
+    "first_token",     # streaming: time until the model's first chunk
+    "generate",        # model call (coalesced callers are not timed twice)
+    "store_history",   # queueing the exchange for write-behind
+)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "copilot_stage_seconds", "Time spent in each stage of a copilot request",
+    ["stage"], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+REQUEST_SECONDS = Histogram(
+    "copilot_request_seconds", "End-to-end copilot request time",
+    ["endpoint"], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+MODEL_SECONDS = Histogram(
+    "copilot_model_seconds", "Model generation time per backend",
+    ["model"], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+CACHE_LOOKUPS = Counter(
+    "copilot_cache_lookups_total", "Response cache lookups by result (exact, semantic or miss)",
+    ["model", "copilot_type", "result"], registry=REGISTRY
+)
+MODEL_TOKENS = Counter(
+    "copilot_model_tokens_total", "Provider token usage (input, output, cache_read, cache_write)",
+    ["model", "kind"], registry=REGISTRY
+)
+ERRORS = Counter(
+    "copilot_errors_total", "Failed copilot requests by reason",
+    ["model", "reason"], registry=REGISTRY
+)
+
+# Children are resolved once so the hot path skips the label lookup
+_stage_timers = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+
+@contextmanager
+def stage(name: str):
+    """Time a request stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_timers[name].observe(time.perf_counter() - started)
+
+def observe_stage(name: str, seconds: float):
+    _stage_timers[name].observe(seconds)
+
+def observe_model(model: str, seconds: float):
+    MODEL_SECONDS.labels(model).observe(seconds)
+
+def timed(endpoint: str):
+    """Decorator recording an async handler's duration in copilot_request_seconds"""
+    histogram = REQUEST_SECONDS.labels(endpoint)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def record_cache(model: str, copilot_type: str, tier: Optional[str]):
+    CACHE_LOOKUPS.labels(model, copilot_type, tier or "miss").inc()
+
+def record_usage(model: str, usage: Optional[Dict]):
+    """Count the token usage a model reported for one generation"""
+    for kind in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"):
+        if usage and usage.get(kind):
+            MODEL_TOKENS.labels(model, kind[:-len("_tokens")]).inc(usage[kind])
+
+def record_error(model: str, reason: str):
+    ERRORS.labels(model, reason).inc()
+
+class StateCollector:
+    """Reads gauges from the app's components at scrape time (no hot-path cost)"""
+
+    def __init__(self):
+        self.state = None
+
+    def bind(self, state):
+        self.state = state
+
+    def collect(self):
+        state = self.state
+        if state is None:
+            return
+
+        inflight = GaugeMetricFamily("copilot_model_inflight", "Generations running per backend", labels=["model"])
+        queued = GaugeMetricFamily("copilot_model_queued", "Requests waiting for a generation slot", labels=["model"])
+        rejected = CounterMetricFamily("copilot_model_rejected", "Requests shed by admission control", labels=["model"])
+        for name, gate in state.admission.stats().items():
+            inflight.add_metric([name], gate["active"])
+            queued.add_metric([name], gate["queued"])
+            rejected.add_metric([name], gate["rejected"])
+        yield inflight
+        yield queued
+        yield rejected
+
+        yield GaugeMetricFamily(
+            "copilot_write_behind_pending", "Writes queued for Redis", value=state.write_behind.depth()
+        )
+        yield GaugeMetricFamily(
+            "copilot_coalesced_inflight", "Distinct prompts being generated", value=state.single_flight.inflight()
+        )
+        cache_stats = state.response_cache.stats()
+        yield GaugeMetricFamily("copilot_l1_cache_entries", "Entries in the in-process cache", value=cache_stats["l1_entries"])
+        yield GaugeMetricFamily("copilot_l1_cache_bytes", "Bytes held by the in-process cache", value=cache_stats["l1_bytes"])
+
+        compressor = state.compressor
+        yield CounterMetricFamily(
+            "copilot_compression_input_bytes", "Bytes of cache and history values before compression",
+            value=compressor.raw_bytes
+        )
+        yield CounterMetricFamily(
+            "copilot_compression_output_bytes", "Bytes of cache and history values as stored",
+            value=compressor.stored_bytes
+        )
+        yield GaugeMetricFamily(
+            "copilot_compression_ratio", "Input bytes per stored byte since startup", value=compressor.ratio()
+        )
+
+state_collector = StateCollector()
+REGISTRY.register(state_collector)
+
+def render() -> bytes:
+    """Current metrics in the Prometheus text format"""
+    return generate_latest(REGISTRY)
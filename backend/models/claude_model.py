@@ -1,39 +1,110 @@
 import anthropic
 import os
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
+
+# Marks the end of a prompt prefix the API should cache (5 minute TTL, refreshed on use)
+CACHE_BREAKPOINT = {"type": "ephemeral"}
 
 class ClaudeModel:
-    def __init__(self, model: str = "claude-opus-4-6"):
-        self.client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    def __init__(self, model: str = "claude-opus-4-6", client: Optional[anthropic.AsyncAnthropic] = None):
+        # A shared, pooled client can be passed in; otherwise one is created for this model
+        self.client = client or anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
         self.model = model
 
-    async def generate_response(
+    def _build_messages(
         self,
         user_prompt: str,
-        system_prompt: str,
         conversation_history: List[Dict] = None
-    ) -> str:
-        """Generate response using Claude model"""
+    ) -> List[Dict]:
+        """Build the messages list sent to the API"""
 
         # Build conversation
         messages = []
         if conversation_history:
             for msg in conversation_history:
+                # System notes (e.g. a conversation summary) go in the system prompt instead
+                if msg["role"] == "system":
+                    continue
                 messages.append({
                     "role": msg["role"],
                     "content": msg["content"]
                 })
 
+        # Cache the conversation so far: next turn it is an unchanged prefix, and the
+        # API finds this breakpoint when looking back from the new one
+        if messages:
+            messages[-1]["content"] = [{
+                "type": "text",
+                "text": messages[-1]["content"],
+                "cache_control": CACHE_BREAKPOINT
+            }]
+
         # Add current prompt
         messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    def _build_system(self, system_prompt: str, conversation_history: List[Dict] = None) -> List[Dict]:
+        """System blocks: the specialized prompt, then any system notes from the history"""
+        notes = [msg["content"] for msg in conversation_history or [] if msg["role"] == "system"]
+        blocks = [{"type": "text", "text": text} for text in [system_prompt, *notes]]
+        # The system prompt is identical for every request of a copilot type; notes
+        # change now and then and are covered by the breakpoint on the history
+        blocks[0]["cache_control"] = CACHE_BREAKPOINT
+        return blocks
+
+    @staticmethod
+    def _record_usage(usage: Optional[Dict], api_usage):
+        """Copy token counts, including prompt cache reads/writes, into ``usage``"""
+        if usage is None or api_usage is None:
+            return
+        usage.update({
+            "input_tokens": api_usage.input_tokens,
+            "output_tokens": api_usage.output_tokens,
+            "cache_read_tokens": api_usage.cache_read_input_tokens or 0,
+            "cache_write_tokens": api_usage.cache_creation_input_tokens or 0
+        })
+
+    async def generate_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """Generate response using Claude model (token counts are written to ``usage``)"""
+
+        messages = self._build_messages(user_prompt, conversation_history)
 
         # Get response
         response = await self.client.messages.create(
             model=self.model,
-            system=system_prompt,
+            system=self._build_system(system_prompt, conversation_history),
             messages=messages,
             max_tokens=1000,
             temperature=0.3
         )
 
-        return response.content[0].text
\ No newline at end of file
+        self._record_usage(usage, response.usage)
+        return response.content[0].text
+
+    async def stream_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Stream response text chunks from Claude model as they are generated"""
+
+        messages = self._build_messages(user_prompt, conversation_history)
+
+        async with self.client.messages.stream(
+            model=self.model,
+            system=self._build_system(system_prompt, conversation_history),
+            messages=messages,
+            max_tokens=1000,
+            temperature=0.3
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            self._record_usage(usage, (await stream.get_final_message()).usage)
@@ -1,55 +1,292 @@
+import asyncio
 import httpx
 import os
 import json
-from typing import List, Dict, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Optional, Union
+
+from .ollama_pool import OllamaHost, OllamaPool
+
+# Prefixes of the error messages generate_response returns instead of raising
+ERROR_PREFIXES = ("Error: ", "Error generating response: ")
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+# Loads shorter than this mean the model was already resident
+COLD_LOAD_SECONDS = 1.0
+
+def parse_keep_alive(value: Union[str, int, float, None]) -> Optional[float]:
+    """Seconds an Ollama keep_alive value ("30m", "1h", "300", -1) keeps a model loaded; inf if forever"""
+    if value is None or value == "":
+        return None
+    text = str(value).strip()
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in ("ms", "s", "m", "h"):
+        if text.endswith(suffix):
+            seconds = float(text[:-len(suffix)]) * units[suffix]
+            break
+    else:
+        seconds = float(text)
+    return float("inf") if seconds < 0 else seconds
 
 class LocalModel:
-    def __init__(self, model_path: str = None, model_name: str = "llama3"):
+    def __init__(
+        self,
+        model_path: str = None,
+        model_name: str = "llama3",
+        http_client: Optional[httpx.AsyncClient] = None,
+        keep_alive: Optional[str] = None,
+        num_ctx: Optional[int] = None,
+        load_timeout: float = 300.0,
+        pool: Optional[OllamaPool] = None
+    ):
         # model_path is kept for compatibility but we mainly use model_name for Ollama
         self.model_name = model_name
-        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    
-    async def generate_response(
+        # Ollama hosts to balance over; a single OLLAMA_BASE_URL unless a shared pool is given
+        self.pool = pool or OllamaPool([os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")], client=http_client)
+        self.base_url = self.pool.hosts[0].url
+        # Shared keep-alive client; without one a client is opened per request
+        self.http_client = http_client
+        # How long Ollama keeps the model in memory after a request (Ollama's default if None)
+        self.keep_alive = keep_alive
+        # Context window; every request must use the same value or Ollama reloads the model
+        self.num_ctx = num_ctx
+        # Read timeout while the model may still be loading into memory
+        self.load_timeout = load_timeout
+        
+        # Load state, from what Ollama reported on the last requests (residency is tracked per host)
+        self.state = "cold"
+        self.last_load_seconds: Optional[float] = None
+        self.cold_loads = 0
+        self.last_ping: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[httpx.AsyncClient]:
+        """Yield the shared HTTP client, or a short-lived one if none was provided"""
+        if self.http_client is not None:
+            yield self.http_client
+        else:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                yield client
+
+    def _build_messages(
         self,
         user_prompt: str,
         system_prompt: str,
         conversation_history: List[Dict] = None
-    ) -> str:
-        """Generate response using local Ollama model"""
-        
+    ) -> List[Dict]:
+        """Build the chat messages list sent to Ollama"""
+
         # Build prompt/messages structure
         messages = [{"role": "system", "content": system_prompt}]
-        
+
         if conversation_history:
             for msg in conversation_history:
                 messages.append({
                     "role": msg["role"],
                     "content": msg["content"]
                 })
-        
+
         messages.append({"role": "user", "content": user_prompt})
-        
+        return messages
+
+    def _options(self) -> Dict:
+        options = {"temperature": 0.7}
+        if self.num_ctx:
+            options["num_ctx"] = self.num_ctx
+        return options
+
+    def _payload(self, messages: List[Dict], stream: bool) -> Dict:
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "options": self._options()
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def is_loaded(self) -> bool:
+        """Whether the model should still be in the memory of at least one Ollama host"""
+        return any(host.is_resident(self.model_name) for host in self.pool.hosts)
+
+    def _timeout(self, host: OllamaHost):
+        """Per-request timeout: a cold model may spend most of a minute loading before the first token"""
+        if host.is_resident(self.model_name):
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(self.load_timeout, connect=10.0)
+
+    def _record_load(self, host: OllamaHost, result: Dict):
+        """Update the load state from a final reply (which carries load_duration)"""
+        load_seconds = result.get("load_duration", 0) / NANOSECONDS
+        if load_seconds >= COLD_LOAD_SECONDS or self.last_load_seconds is None:
+            self.last_load_seconds = load_seconds
+        if load_seconds >= COLD_LOAD_SECONDS:
+            self.cold_loads += 1
+        keep_alive = parse_keep_alive(self.keep_alive)
+        # Ollama keeps models for 5 minutes unless told otherwise
+        host.mark_resident(self.model_name, 300.0 if keep_alive is None else keep_alive)
+        self.pool.record_generation(host)
+        self.state = "loaded"
+        self.last_error = None
+
+    async def warm_up(self) -> bool:
+        """Load the model into every available host's memory (or extend its keep_alive) without generating"""
+        if self.state != "loaded":
+            self.state = "loading"
+        results = await asyncio.gather(*(self._warm_host(host) for host in self.pool.available_hosts()))
+        if not any(results):
+            self.state = "error"
+            return False
+        self.last_ping = time.time()
+        return True
+
+    async def _warm_host(self, host: OllamaHost) -> bool:
+        # An empty message list only loads the model
+        payload = self._payload([], stream=False)
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            async with self.pool.track(host), self._client() as client:
                 response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": self.model_name,
-                        "messages": messages,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7
-                        }
-                    }
+                    f"{host.url}/api/chat", json=payload, timeout=httpx.Timeout(self.load_timeout, connect=10.0)
                 )
-                
+            self.pool.record_status(host, response.status_code)
+            response.raise_for_status()
+            self._record_load(host, response.json())
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            print(f"[WARNING] Could not load Ollama model {self.model_name} on {host.url}: {self.last_error}")
+            return False
+        return True
+
+    def stats(self) -> Dict:
+        """Load state for the health endpoint"""
+        return {
+            "state": self.state if self.state != "loaded" or self.is_loaded() else "expired",
+            "resident_on": [host.url for host in self.pool.hosts if host.is_resident(self.model_name)],
+            "keep_alive": self.keep_alive,
+            "num_ctx": self.num_ctx,
+            "last_load_ms": round(self.last_load_seconds * 1000) if self.last_load_seconds is not None else None,
+            "cold_loads": self.cold_loads,
+            "last_ping": self.last_ping,
+            "last_error": self.last_error
+        }
+
+    @staticmethod
+    def is_error(response: str) -> bool:
+        """Whether a generate_response result is one of its error messages"""
+        return response.startswith(ERROR_PREFIXES)
+
+    @staticmethod
+    def _record_usage(usage: Optional[Dict], result: Dict):
+        """Copy token counts from Ollama's final reply into ``usage``"""
+        if usage is None:
+            return
+        usage.update({
+            "input_tokens": result.get("prompt_eval_count", 0),
+            "output_tokens": result.get("eval_count", 0)
+        })
+
+    async def generate_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """Generate response using local Ollama model (token counts are written to ``usage``)"""
+
+        messages = self._build_messages(user_prompt, system_prompt, conversation_history)
+        tried = []
+
+        while True:
+            host = self.pool.choose(self.model_name, exclude=tried)
+            try:
+                async with self.pool.track(host), self._client() as client:
+                    response = await client.post(
+                        f"{host.url}/api/chat",
+                        json=self._payload(messages, stream=False),
+                        timeout=self._timeout(host)
+                    )
+                self.pool.record_status(host, response.status_code)
+                if response.status_code >= 500 and len(tried) + 1 < len(self.pool.hosts):
+                    # The host failed before generating anything: try the next one
+                    tried.append(host)
+                    continue
+
                 if response.status_code == 200:
                     result = response.json()
+                    self._record_load(host, result)
+                    self._record_usage(usage, result)
                     return result.get("message", {}).get("content", "")
                 else:
                     return f"Error: Local model returned status {response.status_code}"
-                    
-        except httpx.ConnectError:
-            return "Error: Could not connect to local Ollama instance. Is it running?"
-        except Exception as e:
-            return f"Error generating response: {str(e)}"
\ No newline at end of file
+
+            except httpx.ConnectError:
+                # Nothing was sent: try the next host
+                tried.append(host)
+                if len(tried) < len(self.pool.hosts):
+                    continue
+                return "Error: Could not connect to local Ollama instance. Is it running?"
+            except Exception as e:
+                return f"Error generating response: {str(e)}"
+
+    async def stream_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Stream response text chunks from local Ollama model as they are generated.
+
+        Unlike generate_response, errors are raised rather than returned as text so
+        that a failed stream is never mistaken for a (partial) answer.
+        """
+
+        messages = self._build_messages(user_prompt, system_prompt, conversation_history)
+
+        tried = []
+
+        while True:
+            host = self.pool.choose(self.model_name, exclude=tried)
+            try:
+                # The read timeout applies per chunk, so long generations are fine as long as they keep streaming
+                async with self.pool.track(host), self._client() as client:
+                    async with client.stream(
+                        "POST",
+                        f"{host.url}/api/chat",
+                        json=self._payload(messages, stream=True),
+                        timeout=self._timeout(host)
+                    ) as response:
+                        self.pool.record_status(host, response.status_code)
+                        if response.status_code >= 500 and len(tried) + 1 < len(self.pool.hosts):
+                            # Nothing was streamed yet: try the next host
+                            tried.append(host)
+                            continue
+                        if response.status_code != 200:
+                            raise RuntimeError(f"Local model returned status {response.status_code}")
+
+                        # Ollama streams newline-delimited JSON objects
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            if chunk.get("error"):
+                                raise RuntimeError(chunk["error"])
+                            content = chunk.get("message", {}).get("content", "")
+                            if content:
+                                yield content
+                            if chunk.get("done"):
+                                self._record_load(host, chunk)
+                                self._record_usage(usage, chunk)
+                                break
+                return
+            except httpx.ConnectError:
+                # Raised before anything was streamed: try the next host
+                tried.append(host)
+                if len(tried) >= len(self.pool.hosts):
+                    raise
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+
+# Longest a repeatedly failing host stays ejected
+MAX_EJECT_SECONDS = 300.0
+
+def model_key(name: str) -> str:
+    """Ollama's canonical model name ("llama3" is "llama3:latest")"""
+    return name if ":" in name else f"{name}:latest"
+
+class OllamaHost:
+    """One Ollama server: in-flight requests, failure streak and resident models"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+        # Model -> monotonic time until which it should stay in this host's memory
+        self.resident: Dict[str, float] = {}
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def is_resident(self, model: str) -> bool:
+        return self.resident.get(model_key(model), 0.0) > time.monotonic()
+
+    def mark_resident(self, model: str, seconds: float):
+        self.resident[model_key(model)] = time.monotonic() + seconds
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "available": self.available(now),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected_for": round(self.ejected_until - now, 1) if not self.available(now) else 0,
+            "resident_models": sorted(model for model, until in self.resident.items() if until > now),
+            "last_error": self.last_error
+        }
+
+class OllamaPool:
+    """Spreads local model requests over several Ollama hosts.
+
+    Each request goes to the available host with the lowest score: its
+    outstanding requests, plus ``affinity_weight`` if the model is not loaded
+    there (a load costs about as much as waiting behind that many requests).
+    Ties are broken at random.
+
+    Requests that fail before reaching a model (connection refused, 5xx) are
+    retried on the next best host by LocalModel. After ``max_failures``
+    consecutive failures (connection errors, timeouts, 5xx replies) a host is
+    ejected for ``eject_seconds``, doubling on each repeat up to
+    MAX_EJECT_SECONDS until the host completes a generation again. It is
+    re-admitted when that expires, or earlier once a health check succeeds.
+    Health checks (every ``health_interval`` seconds) also refresh which models
+    each host has in memory. If every host is ejected, the one due back first
+    is used anyway.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        client: Optional[httpx.AsyncClient] = None,
+        max_failures: int = 3,
+        eject_seconds: float = 30.0,
+        health_interval: float = 10.0,
+        affinity_weight: float = 4.0
+    ):
+        self.hosts = [OllamaHost(url) for url in urls]
+        if not self.hosts:
+            raise ValueError("OllamaPool needs at least one host")
+        self.client = client
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.affinity_weight = affinity_weight
+        self._task = None
+
+    @classmethod
+    def from_env(cls, client: Optional[httpx.AsyncClient] = None) -> "OllamaPool":
+        """Build from OLLAMA_HOSTS (comma-separated, default OLLAMA_BASE_URL) / OLLAMA_MAX_FAILURES /
+        OLLAMA_EJECT_SECONDS / OLLAMA_HEALTH_INTERVAL / OLLAMA_AFFINITY_WEIGHT"""
+        urls = [url.strip() for url in os.getenv("OLLAMA_HOSTS", "").split(",") if url.strip()]
+        return cls(
+            urls or [os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")],
+            client=client,
+            max_failures=int(os.getenv("OLLAMA_MAX_FAILURES", "3")),
+            eject_seconds=float(os.getenv("OLLAMA_EJECT_SECONDS", "30")),
+            health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+            affinity_weight=float(os.getenv("OLLAMA_AFFINITY_WEIGHT", "4"))
+        )
+
+    def start(self):
+        """Start background health checks (only useful with more than one host)"""
+        if len(self.hosts) > 1 and self.health_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Balancing
+
+    def choose(self, model: str, exclude: Iterable[OllamaHost] = ()) -> OllamaHost:
+        """Host for the next request for ``model`` (hosts in ``exclude`` already failed it)"""
+        now = time.monotonic()
+        candidates = [host for host in self.hosts if host not in exclude] or self.hosts
+        available = [host for host in candidates if host.available(now)]
+        if not available:
+            # Everything is ejected: try the host that is due back first
+            return min(candidates, key=lambda host: host.ejected_until)
+
+        def score(host: OllamaHost) -> float:
+            return host.outstanding + (0 if host.is_resident(model) else self.affinity_weight)
+
+        best = min(score(host) for host in available)
+        return random.choice([host for host in available if score(host) == best])
+
+    def available_hosts(self) -> List[OllamaHost]:
+        now = time.monotonic()
+        return [host for host in self.hosts if host.available(now)]
+
+    @asynccontextmanager
+    async def track(self, host: OllamaHost) -> AsyncIterator[OllamaHost]:
+        """Count a request against ``host``; transport errors count as host failures"""
+        host.outstanding += 1
+        host.requests += 1
+        try:
+            yield host
+        except httpx.TransportError as e:
+            self.record_failure(host, e)
+            raise
+        finally:
+            host.outstanding -= 1
+
+    def record_status(self, host: OllamaHost, status_code: int):
+        """5xx replies count as host failures; anything else shows the host is up"""
+        if status_code >= 500:
+            self.record_failure(host, f"status {status_code}")
+        else:
+            self.record_success(host)
+
+    def record_success(self, host: OllamaHost):
+        """The host answered: clear its failure streak and re-admit it"""
+        host.failures = 0
+        host.ejected_until = 0.0
+
+    def record_generation(self, host: OllamaHost):
+        """The host completed a generation, so its next ejection starts again at ``eject_seconds``"""
+        self.record_success(host)
+        host.ejections = 0
+
+    def record_failure(self, host: OllamaHost, error):
+        host.failures += 1
+        host.last_error = str(error) or type(error).__name__
+        if host.failures >= self.max_failures and host.available(time.monotonic()):
+            seconds = min(self.eject_seconds * 2 ** host.ejections, MAX_EJECT_SECONDS)
+            host.ejections += 1
+            host.ejected_until = time.monotonic() + seconds
+            host.resident.clear()
+            print(f"[WARNING] Ollama host {host.url} ejected for {seconds:.0f}s after {host.failures} failures: {host.last_error}")
+
+    # Health checks
+
+    async def _get(self, url: str) -> httpx.Response:
+        if self.client is not None:
+            return await self.client.get(url, timeout=5.0)
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            return await client.get(url)
+
+    async def check(self, host: OllamaHost) -> bool:
+        """Ask ``host`` which models it has loaded; re-admits it if it answers"""
+        try:
+            response = await self._get(f"{host.url}/api/ps")
+            if response.status_code == 404:
+                # Ollama before /api/ps: /api/tags still shows the host is up, but not what is loaded
+                response = await self._get(f"{host.url}/api/tags")
+                response.raise_for_status()
+                loaded = None
+            else:
+                response.raise_for_status()
+                loaded = {model_key(entry.get("name") or entry.get("model", "")) for entry in response.json().get("models", [])}
+        except Exception as e:
+            self.record_failure(host, e)
+            return False
+
+        if not host.available(time.monotonic()):
+            print(f"[INFO] Ollama host {host.url} is back")
+        self.record_success(host)
+        if loaded is None:
+            # Residency stays as the replies to generation requests reported it
+            return True
+        # Models evicted since the last check lose their affinity; loaded ones stay at least until the next check
+        until = time.monotonic() + self.health_interval
+        host.resident = {
+            model: max(host.resident.get(model, 0.0), until) for model in loaded
+        }
+        return True
+
+    async def _health_loop(self):
+        # The first round runs right away, so affinity is known before the first requests
+        while True:
+            await asyncio.gather(*(self.check(host) for host in self.hosts))
+            await asyncio.sleep(self.health_interval)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-host load, health and resident models for the health endpoint"""
+        return {host.url: host.stats() for host in self.hosts}
@@ -1,19 +1,24 @@
 from openai import AsyncOpenAI
 import os
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 
 class OpenAIModel:
-    def __init__(self, model: str = "gpt-4o"):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, model: str = "gpt-4o", client: Optional[AsyncOpenAI] = None):
+        # A shared, pooled client can be passed in; otherwise one is created for this model
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = model
 
-    async def generate_response(
+    def _build_messages(
         self,
         user_prompt: str,
         system_prompt: str,
         conversation_history: List[Dict] = None
-    ) -> str:
-        """Generate response using OpenAI model"""
+    ) -> List[Dict]:
+        """Build the chat messages list sent to the API.
+
+        Stable content comes first (system prompt, then history oldest to newest)
+        so consecutive turns share a prefix the API caches automatically.
+        """
 
         # Build messages
         messages = [{"role": "system", "content": system_prompt}]
@@ -28,6 +33,32 @@ class OpenAIModel:
 
         # Add current prompt
         messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    @staticmethod
+    def _record_usage(usage: Optional[Dict], api_usage):
+        """Copy token counts, including cached prompt tokens, into ``usage``"""
+        if usage is None or api_usage is None:
+            return
+        details = api_usage.prompt_tokens_details
+        usage.update({
+            "input_tokens": api_usage.prompt_tokens,
+            "output_tokens": api_usage.completion_tokens,
+            "cache_read_tokens": (details.cached_tokens or 0) if details else 0,
+            # OpenAI caches prefixes automatically and does not bill cache writes
+            "cache_write_tokens": 0
+        })
+
+    async def generate_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """Generate response using OpenAI model (token counts are written to ``usage``)"""
+
+        messages = self._build_messages(user_prompt, system_prompt, conversation_history)
 
         # Get response
         response = await self.client.chat.completions.create(
@@ -37,4 +68,32 @@ class OpenAIModel:
             max_tokens=1000
         )
 
-        return response.choices[0].message.content
\ No newline at end of file
+        self._record_usage(usage, response.usage)
+        return response.choices[0].message.content
+
+    async def stream_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Stream response text chunks from OpenAI model as they are generated"""
+
+        messages = self._build_messages(user_prompt, system_prompt, conversation_history)
+
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=1000,
+            stream=True,
+            # Token counts arrive in a final chunk without choices
+            stream_options={"include_usage": True}
+        )
+
+        async for chunk in stream:
+            if chunk.usage:
+                self._record_usage(usage, chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
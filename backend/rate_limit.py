@@ -0,0 +1,250 @@
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .scripts import Script
+
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
+
+# Checks every key and only consumes quota if all of them allow the request.
+# State is kept in one string per key so the script only needs GET/SET:
+#   sliding window  "<window index>:<previous window count>:<current window count>"
+#   token bucket    "<tokens>:<last refill ms>"
+# KEYS: one per identity; ARGV: algorithm, window ms, cost, then one limit per key.
+# Returns {allowed (0/1), remaining (lowest across keys), retry after ms}.
+RATE_LIMIT_LUA = """
+-- Needed before TIME on Redis < 5 (effects replication); a no-op since Redis 7
+if redis.replicate_commands then
+  redis.replicate_commands()
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local algorithm = ARGV[1]
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local function split(raw)
+  local parts = {}
+  for part in string.gmatch(raw, '[^:]+') do
+    parts[#parts + 1] = tonumber(part)
+  end
+  return parts
+end
+
+local allowed = 1
+local remaining = -1
+local retry = 0
+local states = {}
+
+for i, key in ipairs(KEYS) do
+  local limit = tonumber(ARGV[3 + i])
+  local raw = redis.call('GET', key)
+  local left, wait, state
+
+  if algorithm == 'token_bucket' then
+    local tokens, last = limit, now
+    if raw then
+      local parts = split(raw)
+      tokens, last = parts[1], parts[2]
+    end
+    local rate = limit / window
+    tokens = math.min(limit, tokens + math.max(0, now - last) * rate)
+    wait = 0
+    if cost > limit then
+      wait = window
+    elseif tokens >= cost then
+      tokens = tokens - cost
+    else
+      wait = math.ceil((cost - tokens) / rate)
+    end
+    left = math.floor(tokens)
+    state = string.format('%.6f:%d', tokens, now)
+  else
+    local current = math.floor(now / window)
+    local prev, cur = 0, 0
+    if raw then
+      local parts = split(raw)
+      if parts[1] == current then
+        prev, cur = parts[2], parts[3]
+      elseif parts[1] == current - 1 then
+        prev = parts[3]
+      end
+    end
+    local elapsed = now - current * window
+    local weight = (window - elapsed) / window
+    wait = 0
+    if cost > limit then
+      wait = window
+    elseif prev * weight + cur + cost <= limit then
+      cur = cur + cost
+    elseif cur + cost <= limit then
+      wait = math.max(1, math.ceil(window * (1 - (limit - cur - cost) / prev) - elapsed))
+    else
+      local next_elapsed = 0
+      if cur > 0 then
+        next_elapsed = math.max(0, window * (1 - (limit - cost) / cur))
+      end
+      wait = math.max(1, math.ceil(window - elapsed + next_elapsed))
+    end
+    left = math.max(0, math.floor(limit - (prev * weight + cur)))
+    state = string.format('%d:%d:%d', current, prev, cur)
+  end
+
+  if wait > 0 then
+    allowed = 0
+  end
+  retry = math.max(retry, wait)
+  if remaining < 0 or left < remaining then
+    remaining = left
+  end
+  states[i] = state
+end
+
+if allowed == 1 then
+  for i, key in ipairs(KEYS) do
+    redis.call('SET', key, states[i], 'PX', window * 2)
+  end
+end
+
+return {allowed, remaining, retry}
+"""
+
+def _evaluate(algorithm: str, raw: Optional[str], now: int, limit: int, window: int, cost: int) -> Tuple[int, int, str]:
+    """Python twin of one iteration of RATE_LIMIT_LUA: returns (remaining, wait ms, state)"""
+    parts = [float(part) for part in raw.split(":")] if raw else None
+
+    if algorithm == TOKEN_BUCKET:
+        tokens, last = (parts[0], parts[1]) if parts else (limit, now)
+        rate = limit / window
+        tokens = min(limit, tokens + max(0, now - last) * rate)
+        wait = 0
+        if cost > limit:
+            wait = window
+        elif tokens >= cost:
+            tokens -= cost
+        else:
+            wait = math.ceil((cost - tokens) / rate)
+        return math.floor(tokens), wait, f"{tokens:.6f}:{now}"
+
+    current = now // window
+    prev, cur = 0, 0
+    if parts:
+        if parts[0] == current:
+            prev, cur = parts[1], parts[2]
+        elif parts[0] == current - 1:
+            prev = parts[2]
+    elapsed = now - current * window
+    weight = (window - elapsed) / window
+    wait = 0
+    if cost > limit:
+        wait = window
+    elif prev * weight + cur + cost <= limit:
+        cur += cost
+    elif cur + cost <= limit:
+        wait = max(1, math.ceil(window * (1 - (limit - cur - cost) / prev) - elapsed))
+    else:
+        next_elapsed = max(0, window * (1 - (limit - cost) / cur)) if cur > 0 else 0
+        wait = max(1, math.ceil(window - elapsed + next_elapsed))
+    remaining = max(0, math.floor(limit - (prev * weight + cur)))
+    return remaining, wait, f"{current}:{int(prev)}:{int(cur)}"
+
+def _rate_limit_local(store, keys: List[str], args: List) -> List[int]:
+    """In-process implementation of RATE_LIMIT_LUA for local stores"""
+    now = int(time.time() * 1000)
+    algorithm, window, cost = args[0], int(args[1]), int(args[2])
+
+    allowed, remaining, retry = 1, -1, 0
+    states = []
+    for key, limit in zip(keys, args[3:]):
+        left, wait, state = _evaluate(algorithm, store.sync_get(key), now, int(limit), window, cost)
+        if wait > 0:
+            allowed = 0
+        retry = max(retry, wait)
+        remaining = left if remaining < 0 else min(remaining, left)
+        states.append(state)
+
+    if allowed:
+        for key, state in zip(keys, states):
+            store.sync_set(key, state, px=window * 2)
+    return [allowed, remaining, retry]
+
+RATE_LIMIT_SCRIPT = Script(RATE_LIMIT_LUA, _rate_limit_local)
+
+class RateLimiter:
+    """Atomic rate limiting in a single round-trip.
+
+    Each request is checked against several identities at once (client IP and
+    API key), each with its own limit, using either a sliding window (weighted
+    previous + current fixed windows) or a token bucket that refills at
+    ``limit / window`` and allows bursts up to ``limit``.
+    """
+
+    def __init__(
+        self,
+        limit: int = 60,
+        window: int = 60,
+        algorithm: str = SLIDING_WINDOW,
+        key_limit: Optional[int] = None
+    ):
+        if algorithm not in (SLIDING_WINDOW, TOKEN_BUCKET):
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+        self.limit = limit
+        self.window = window
+        self.algorithm = algorithm
+        self.key_limit = key_limit if key_limit is not None else limit
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build from RATE_LIMIT / RATE_LIMIT_WINDOW / RATE_LIMIT_ALGORITHM / API_KEY_RATE_LIMIT"""
+        key_limit = os.getenv("API_KEY_RATE_LIMIT")
+        return cls(
+            limit=int(os.getenv("RATE_LIMIT", "60")),
+            window=int(os.getenv("RATE_LIMIT_WINDOW", "60")),
+            algorithm=os.getenv("RATE_LIMIT_ALGORITHM", SLIDING_WINDOW),
+            key_limit=int(key_limit) if key_limit else None
+        )
+
+    def script_call(self, client_ip: str, api_user: Optional[str] = None, cost: int = 1) -> Tuple[List[str], List]:
+        """KEYS and ARGV for one rate limit check"""
+        keys = [f"rate_limit:ip:{client_ip}"]
+        limits = [self.limit]
+        if api_user:
+            keys.append(f"rate_limit:key:{api_user}")
+            limits.append(self.key_limit)
+        return keys, [self.algorithm, self.window * 1000, cost, *limits]
+
+    def max_cost(self, api_user: Optional[str] = None) -> int:
+        """Largest cost a single request can ever be allowed (a higher one is always rejected)"""
+        return min(self.limit, self.key_limit) if api_user else self.limit
+
+    def result(self, raw: List, api_user: Optional[str] = None) -> Dict:
+        """Turn the script's reply into a rate limit decision"""
+        allowed, remaining, retry_ms = (int(value) for value in raw)
+        return {
+            "allowed": bool(allowed),
+            "limit": self.max_cost(api_user),
+            "remaining": max(0, remaining),
+            "retry_after": math.ceil(retry_ms / 1000)
+        }
+
+    async def check(self, client, client_ip: str, api_user: Optional[str] = None, cost: int = 1) -> Dict:
+        """Check and consume quota for a request"""
+        keys, args = self.script_call(client_ip, api_user, cost)
+        return self.result(await RATE_LIMIT_SCRIPT(client, keys, args), api_user)
+
+    async def queue(self, pipe, client_ip: str, api_user: Optional[str] = None, cost: int = 1):
+        """Queue a check on a pipeline; pass its reply to ``result``"""
+        keys, args = self.script_call(client_ip, api_user, cost)
+        await RATE_LIMIT_SCRIPT.queue(pipe, keys, args)
+
+def rate_limit_headers(result: Dict) -> Dict[str, str]:
+    """Standard rate limit response headers for a decision"""
+    headers = {
+        "X-RateLimit-Limit": str(result["limit"]),
+        "X-RateLimit-Remaining": str(result["remaining"]),
+    }
+    if not result["allowed"]:
+        headers["Retry-After"] = str(max(1, result["retry_after"]))
+    return headers
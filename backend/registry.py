@@ -0,0 +1,194 @@
+import asyncio
+import importlib
+import os
+import time
+from typing import AsyncIterator, Dict, Iterable
+
+# Model class per provider and the credential it needs; modules are imported on first use
+PROVIDERS = {
+    "openai": {"module": ".models.openai_model", "class": "OpenAIModel", "api_key": "OPENAI_API_KEY"},
+    "anthropic": {"module": ".models.claude_model", "class": "ClaudeModel", "api_key": "ANTHROPIC_API_KEY"},
+    "ollama": {"module": ".models.local_model", "class": "LocalModel", "api_key": None},
+}
+
+# Model choice -> provider:model
+DEFAULT_MODELS = "gpt4=openai:gpt-4o,gpt35=openai:gpt-3.5-turbo,claude=anthropic:claude-opus-4-6,local=ollama:llama3"
+
+def parse_models(value: str) -> Dict[str, Dict]:
+    """Parse ``name=provider:model,...`` into model specs"""
+    specs = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, target = item.split("=", 1)
+        provider, _, model = target.partition(":")
+        specs[name.strip()] = {"provider": provider.strip(), "model": model.strip()}
+    return specs
+
+class LazyModel:
+    """Stand-in for a registered model; the real one is built on first use"""
+
+    def __init__(self, registry: "ModelRegistry", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self.registry.load_sync(self.name), attr)
+
+    async def generate_response(self, *args, **kwargs) -> str:
+        model = await self.registry.load(self.name)
+        return await model.generate_response(*args, **kwargs)
+
+    async def stream_response(self, *args, **kwargs) -> AsyncIterator[str]:
+        model = await self.registry.load(self.name)
+        async for chunk in model.stream_response(*args, **kwargs):
+            yield chunk
+
+class ModelRegistry:
+    """Config-driven model registry with lazy loading.
+
+    Models are declared as ``name=provider:model`` (``MODELS``). A provider's
+    SDK is imported, and its pooled client created, only when one of its models
+    is first used -- or at startup for the models listed in ``WARM_MODELS``.
+    Models whose provider credentials are missing are not registered, so they
+    are rejected as unknown choices instead of failing on every call.
+
+    Warm local models are also preloaded into Ollama's memory during startup
+    and pinged periodically so they stay resident.
+    """
+
+    def __init__(self, specs: Dict[str, Dict], clients, warm: Iterable[str] = (), ping_interval: float = 240.0):
+        self.clients = clients
+        # Seconds between keep-alive pings of warm local models (0 disables)
+        self.ping_interval = ping_interval
+        self._ping_task = None
+        # Ollama hosts shared by every local model; created with the first one
+        self.ollama_pool = None
+        self.specs = {}
+        for name, spec in specs.items():
+            provider = PROVIDERS.get(spec["provider"])
+            if provider is None:
+                print(f"[WARNING] Model {name}: unknown provider {spec['provider']!r}; skipped.")
+            elif provider["api_key"] and not os.getenv(provider["api_key"]):
+                print(f"[WARNING] Model {name}: {provider['api_key']} is not set; skipped.")
+            else:
+                self.specs[name] = spec
+        self.warm = [name for name in warm if name in self.specs]
+        self._loaded: Dict[str, object] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @classmethod
+    def from_env(cls, clients) -> "ModelRegistry":
+        """Build from MODELS (name=provider:model,...) and WARM_MODELS (names, or "all")"""
+        specs = parse_models(os.getenv("MODELS", DEFAULT_MODELS))
+        warm = os.getenv("WARM_MODELS", "")
+        names = specs if warm.strip().lower() == "all" else [name.strip() for name in warm.split(",") if name.strip()]
+        return cls(specs, clients, warm=names, ping_interval=float(os.getenv("OLLAMA_PING_INTERVAL", "240")))
+
+    def proxies(self) -> Dict[str, LazyModel]:
+        """A lazy model per registered name, in configuration order"""
+        return {name: LazyModel(self, name) for name in self.specs}
+
+    def _build(self, name: str):
+        spec = self.specs[name]
+        provider = PROVIDERS[spec["provider"]]
+        model_class = getattr(importlib.import_module(provider["module"], __package__), provider["class"])
+        if spec["provider"] == "openai":
+            return model_class(model=spec["model"], client=self.clients.openai)
+        if spec["provider"] == "anthropic":
+            return model_class(model=spec["model"], client=self.clients.anthropic)
+        if self.ollama_pool is None:
+            pool_module = importlib.import_module(".models.ollama_pool", __package__)
+            self.ollama_pool = pool_module.OllamaPool.from_env(self.clients.ollama)
+            self.ollama_pool.start()
+        # OLLAMA_KEEP_ALIVE / OLLAMA_NUM_CTX, overridable per model with an _<NAME> suffix
+        suffix = name.upper()
+        num_ctx = os.getenv(f"OLLAMA_NUM_CTX_{suffix}", os.getenv("OLLAMA_NUM_CTX", ""))
+        return model_class(
+            model_path=os.getenv("LOCAL_MODEL_PATH", "./models/local"),
+            model_name=spec["model"],
+            http_client=self.clients.ollama,
+            keep_alive=os.getenv(f"OLLAMA_KEEP_ALIVE_{suffix}", os.getenv("OLLAMA_KEEP_ALIVE", "30m")),
+            num_ctx=int(num_ctx) if num_ctx else None,
+            load_timeout=float(os.getenv("OLLAMA_LOAD_TIMEOUT", "300")),
+            pool=self.ollama_pool
+        )
+
+    def _import(self, name: str):
+        importlib.import_module(PROVIDERS[self.specs[name]["provider"]]["module"], __package__)
+
+    async def load(self, name: str):
+        """The model for ``name``, importing its SDK (off the event loop) on first use"""
+        model = self._loaded.get(name)
+        if model is not None:
+            return model
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name not in self._loaded:
+                started = time.perf_counter()
+                # SDK imports take up to a second; keep serving other requests meanwhile
+                await asyncio.to_thread(self._import, name)
+                self._loaded[name] = self._build(name)
+                self._load_seconds[name] = time.perf_counter() - started
+                print(f"[INFO] Loaded model {name} in {self._load_seconds[name] * 1000:.0f}ms")
+        return self._loaded[name]
+
+    def load_sync(self, name: str):
+        """Like ``load`` but blocking; only for attribute access on a model not yet used"""
+        if name not in self._loaded:
+            self._loaded[name] = self._build(name)
+        return self._loaded[name]
+
+    async def warm_up(self):
+        """Load the WARM_MODELS now instead of on their first request.
+
+        Local models are also loaded into Ollama's memory, and kept there by a
+        background ping every ``ping_interval`` seconds.
+        """
+        await asyncio.gather(*(self._warm(name) for name in self.warm))
+        if self.ping_interval > 0 and any(self._pingable(name) for name in self.warm):
+            self._ping_task = asyncio.create_task(self._ping_loop())
+
+    async def _warm(self, name: str):
+        model = await self.load(name)
+        if self._pingable(name):
+            started = time.perf_counter()
+            if await model.warm_up():
+                print(f"[INFO] Model {name} ({model.model_name}) is resident in Ollama after {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def _pingable(self, name: str) -> bool:
+        return hasattr(self._loaded.get(name), "warm_up")
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            # Extends keep_alive, and reloads models Ollama evicted to make room for others
+            await asyncio.gather(*(self._loaded[name].warm_up() for name in self.warm if self._pingable(name)))
+
+    async def close(self):
+        if self._ping_task:
+            self._ping_task.cancel()
+            try:
+                await self._ping_task
+            except asyncio.CancelledError:
+                pass
+            self._ping_task = None
+        if self.ollama_pool is not None:
+            await self.ollama_pool.close()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-model provider and load state (and Ollama residency) for the health endpoint"""
+        stats = {}
+        for name, spec in self.specs.items():
+            stats[name] = {
+                "provider": spec["provider"],
+                "model": spec["model"],
+                "loaded": name in self._loaded,
+                "load_ms": round(self._load_seconds[name] * 1000) if name in self._load_seconds else None,
+                "warm": name in self.warm
+            }
+            model = self._loaded.get(name)
+            if hasattr(model, "warm_up"):
+                stats[name]["ollama"] = model.stats()
+        return stats
@@ -0,0 +1,296 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from .admission import AdmissionRejected
+
+DEFAULT_CANDIDATES = ["gpt4", "claude", "gpt35", "local"]
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank percentile of ``samples`` (``q`` in 0..1)"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ModelStats:
+    """Rolling latency (per copilot type) and error window for one model"""
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.down_until = 0.0
+
+    def record(self, copilot_type: str, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.setdefault(copilot_type, deque(maxlen=self.window)).append(latency)
+
+    def samples(self, copilot_type: str) -> Deque[float]:
+        return self.latencies.get(copilot_type, ())
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class ModelRouter:
+    """Routes ``auto`` requests to the fastest healthy model.
+
+    Each copilot type has an ordered list of candidate models. Healthy candidates
+    are ranked by their rolling median latency for that copilot type (models
+    without enough samples are assumed to take ``hedge_delay``). A model whose recent
+    error rate exceeds ``max_error_rate`` is skipped for ``cooldown`` seconds.
+
+    Generation is hedged: if the first model has not answered after its p95
+    latency, the next one is started too and the first answer wins; the other
+    call is cancelled. A model that fails is replaced by the next candidate.
+    """
+
+    def __init__(
+        self,
+        models: Dict,
+        candidates: Dict[str, List[str]] = None,
+        hedge: bool = True,
+        hedge_delay: float = 2.0,
+        min_hedge_delay: float = 0.5,
+        window: int = 100,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0
+    ):
+        self.models = models
+        self.candidates = candidates or {}
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._window = window
+        self._stats: Dict[str, ModelStats] = {}
+
+    @classmethod
+    def from_env(cls, models: Dict) -> "ModelRouter":
+        """Build from ROUTER_MODELS[_<COPILOT>] and ROUTER_* settings"""
+        default = os.getenv("ROUTER_MODELS", ",".join(DEFAULT_CANDIDATES))
+        candidates = {}
+        for copilot_type in ("general", "python", "javascript", "debug"):
+            value = os.getenv(f"ROUTER_MODELS_{copilot_type.upper()}", default)
+            candidates[copilot_type] = [name.strip() for name in value.split(",") if name.strip()]
+        return cls(
+            models,
+            candidates=candidates,
+            hedge=os.getenv("ROUTER_HEDGE_ENABLED", "true").lower() == "true",
+            hedge_delay=float(os.getenv("ROUTER_HEDGE_DELAY", "2.0")),
+            min_hedge_delay=float(os.getenv("ROUTER_MIN_HEDGE_DELAY", "0.5")),
+            window=int(os.getenv("ROUTER_WINDOW", "100")),
+            max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5")),
+            cooldown=float(os.getenv("ROUTER_COOLDOWN", "30"))
+        )
+
+    def stats_for(self, name: str) -> ModelStats:
+        if name not in self._stats:
+            self._stats[name] = ModelStats(self._window)
+        return self._stats[name]
+
+    def healthy(self, name: str) -> bool:
+        return self.stats_for(name).down_until <= time.monotonic()
+
+    def rank(self, copilot_type: str) -> List[str]:
+        """Candidates for a copilot type, best first (unhealthy ones last)"""
+        names = self.candidates.get(copilot_type) or self.candidates.get("general") or DEFAULT_CANDIDATES
+        names = [name for name in names if name in self.models]
+
+        def latency(name: str) -> float:
+            samples = self.stats_for(name).samples(copilot_type)
+            # Until measured, assume the default hedge delay
+            return percentile(samples, 0.5) if len(samples) >= self.min_samples else self.hedge_delay
+
+        # sorted() is stable, so ties keep the configured order
+        ranked = sorted(names, key=latency)
+        return [name for name in ranked if self.healthy(name)] + [name for name in ranked if not self.healthy(name)]
+
+    def hedge_after(self, name: str, copilot_type: str) -> float:
+        """Seconds to wait for ``name`` before hedging: its p95 latency"""
+        samples = self.stats_for(name).samples(copilot_type)
+        if len(samples) < self.min_samples:
+            return self.hedge_delay
+        return max(self.min_hedge_delay, percentile(samples, 0.95))
+
+    def record(self, name: str, copilot_type: str, started: float, ok: bool):
+        stats = self.stats_for(name)
+        stats.record(copilot_type, time.monotonic() - started, ok)
+        if not ok and len(stats.outcomes) >= self.min_samples and stats.error_rate() > self.max_error_rate:
+            stats.down_until = time.monotonic() + self.cooldown
+            stats.outcomes.clear()
+            print(f"[WARNING] Router: {name} is failing, skipping it for {self.cooldown:.0f}s")
+
+    async def _call(self, name: str, copilot_type: str, kwargs: Dict, usage: Dict) -> str:
+        model = self.models[name]
+        started = time.monotonic()
+        try:
+            response = await model.generate_response(**kwargs, usage=usage)
+            # The local model reports some failures as text instead of raising
+            is_error = getattr(model, "is_error", None)
+            if is_error and is_error(response):
+                raise RuntimeError(response)
+        except (asyncio.CancelledError, AdmissionRejected):
+            # Lost a hedge race or the model is saturated; says nothing about its health
+            raise
+        except Exception:
+            self.record(name, copilot_type, started, ok=False)
+            raise
+        self.record(name, copilot_type, started, ok=True)
+        return response
+
+    async def generate(self, copilot_type: str, usage: Optional[Dict] = None, **kwargs) -> Dict:
+        """Generate with hedging and fallback; returns {"model": name, "response": text}"""
+        order = self.rank(copilot_type)
+        if not order:
+            raise RuntimeError("No models available for routing")
+
+        pending: Dict[asyncio.Task, tuple] = {}
+        errors = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            name = order[next_index]
+            next_index += 1
+            call_usage = {}
+            task = asyncio.create_task(self._call(name, copilot_type, kwargs, call_usage))
+            pending[task] = (name, call_usage)
+
+        launch()
+        hedged = False
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and not hedged and next_index < len(order):
+                    timeout = self.hedge_after(order[next_index - 1], copilot_type)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual: race the next candidate
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    name, call_usage = pending.pop(task)
+                    if task.exception() is None:
+                        if usage is not None:
+                            usage.update(call_usage)
+                        return {"model": name, "response": task.result()}
+                    errors.append((name, task.exception()))
+                # Fall back to the next candidate once nothing is left running
+                if not pending and next_index < len(order):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        raise self._failure(errors)
+
+    @staticmethod
+    def _failure(errors: List) -> Exception:
+        """Error to raise once every candidate failed"""
+        rejections = [error for _, error in errors if isinstance(error, AdmissionRejected)]
+        if len(rejections) == len(errors):
+            # Every model is saturated: report the soonest retry
+            return min(rejections, key=lambda error: error.retry_after)
+        return RuntimeError("All models failed (" + "; ".join(f"{name}: {error}" for name, error in errors) + ")")
+
+    async def stream(self, copilot_type: str, route: Dict, usage: Optional[Dict] = None, **kwargs) -> AsyncIterator[str]:
+        """Stream from the best model, falling back while nothing has been sent yet.
+
+        Streams are not hedged: two token streams cannot be merged. The chosen
+        model's name is written to ``route["model"]``.
+        """
+        order = self.rank(copilot_type)
+        if not order:
+            raise RuntimeError("No models available for routing")
+
+        errors = []
+        for name in order:
+            route["model"] = name
+            started = time.monotonic()
+            sent = False
+            try:
+                async for chunk in self.models[name].stream_response(**kwargs, usage=usage):
+                    sent = True
+                    yield chunk
+            except Exception as e:
+                if not isinstance(e, AdmissionRejected):
+                    self.record(name, copilot_type, started, ok=False)
+                if sent:
+                    raise
+                errors.append((name, e))
+                continue
+            self.record(name, copilot_type, started, ok=True)
+            return
+
+        raise self._failure(errors)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-model routing state for the health endpoint"""
+        result = {}
+        for name in self.models:
+            stats = self.stats_for(name)
+            samples = [latency for window in stats.latencies.values() for latency in window]
+            result[name] = {
+                "healthy": self.healthy(name),
+                "error_rate": round(stats.error_rate(), 3),
+                "p50_ms": round(percentile(samples, 0.5) * 1000) if samples else None,
+                "p95_ms": round(percentile(samples, 0.95) * 1000) if samples else None
+            }
+        return result
+
+class RoutedModel:
+    """Model-like front for the router, bound to one copilot type.
+
+    Created per request; ``served_by`` names the model that produced the answer.
+    """
+
+    def __init__(self, router: ModelRouter, copilot_type: str):
+        self.router = router
+        self.copilot_type = copilot_type
+        self.served_by: Optional[str] = None
+
+    async def generate_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        result = await self.router.generate(
+            self.copilot_type,
+            usage=usage,
+            user_prompt=user_prompt,
+            system_prompt=system_prompt,
+            conversation_history=conversation_history
+        )
+        self.served_by = result["model"]
+        return result["response"]
+
+    async def stream_response(
+        self,
+        user_prompt: str,
+        system_prompt: str,
+        conversation_history: List[Dict] = None,
+        usage: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        route = {}
+        async for chunk in self.router.stream(
+            self.copilot_type,
+            route,
+            usage=usage,
+            user_prompt=user_prompt,
+            system_prompt=system_prompt,
+            conversation_history=conversation_history
+        ):
+            self.served_by = route["model"]
+            yield chunk
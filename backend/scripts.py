@@ -0,0 +1,35 @@
+from typing import Any, Callable, List
+
+class Script:
+    """A server-side Redis Lua script with an equivalent Python implementation.
+
+    On Redis the Lua source is run with EVALSHA (loaded on first use), so the
+    whole operation is atomic and costs one round-trip. In-process stores expose
+    ``run_script`` and execute ``local(store, keys, args)`` instead; it must only
+    use the store's synchronous ``sync_*`` methods so that it runs without
+    yielding to the event loop, which makes it atomic too.
+    """
+
+    def __init__(self, lua: str, local: Callable[[Any, List[str], List[Any]], Any]):
+        self.lua = lua
+        self.local = local
+        self._redis_script = None
+
+    def _registered(self, client):
+        # The script's SHA does not depend on the client, so one registration serves all
+        if self._redis_script is None:
+            self._redis_script = client.register_script(self.lua)
+        return self._redis_script
+
+    async def __call__(self, client, keys: List[str], args: List[Any]):
+        run_script = getattr(client, "run_script", None)
+        if run_script is not None:
+            return await run_script(self, keys, args)
+        return await self._registered(client)(keys=keys, args=args, client=client)
+
+    async def queue(self, pipe, keys: List[str], args: List[Any]):
+        """Add the script to a pipeline; its reply comes back with the pipeline's results"""
+        if hasattr(pipe, "run_script"):
+            pipe.run_script(self, keys, args)
+        else:
+            await self._registered(pipe)(keys=keys, args=args, client=pipe)
@@ -0,0 +1,234 @@
+import base64
+import importlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency: the semantic tier is disabled without it
+    np = None
+
+# Default cosine-similarity thresholds per copilot type. Debugging questions hinge on
+# small details, so they need a much closer match before an answer is reused.
+DEFAULT_THRESHOLDS = {
+    "general": 0.92,
+    "python": 0.93,
+    "javascript": 0.93,
+    "debug": 0.97,
+}
+
+INDEX_KEY = "semantic:index"
+
+class OllamaEmbedder:
+    """Embeds text with the local Ollama embeddings endpoint"""
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, model: str = None):
+        self.http_client = http_client
+        self.model = model or os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+    async def embed(self, text: str) -> List[float]:
+        client = self.http_client or httpx.AsyncClient(timeout=10.0)
+        try:
+            response = await client.post(
+                f"{self.base_url}/api/embeddings",
+                json={"model": self.model, "prompt": text}
+            )
+            response.raise_for_status()
+            return response.json()["embedding"]
+        finally:
+            if client is not self.http_client:
+                await client.aclose()
+
+def load_embedder(spec: str):
+    """Load a custom embedder from a ``module:factory`` spec"""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+class VectorIndex:
+    """In-process nearest-neighbour index over unit vectors stored in a NumPy matrix.
+
+    Search is a single matrix-vector product (cosine similarity). Each key has
+    one entry; adding a key again replaces its vector. Once ``max_entries`` is
+    reached the oldest entries are overwritten.
+    """
+
+    def __init__(self, dim: int, max_entries: int = 10000):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.vectors = np.zeros((min(max_entries, 256), dim), dtype=np.float32)
+        self.keys: List[str] = []
+        # key -> row in ``vectors``, so a key is indexed at most once
+        self._slots: Dict[str, int] = {}
+        self._next = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, vector, key: str):
+        """Index ``vector`` under ``key``, replacing the key's previous vector if any"""
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self.keys) < self.max_entries:
+                if len(self.keys) == len(self.vectors):
+                    grown = np.zeros((min(len(self.vectors) * 2, self.max_entries), self.dim), dtype=np.float32)
+                    grown[:len(self.vectors)] = self.vectors
+                    self.vectors = grown
+                slot = len(self.keys)
+                self.keys.append(key)
+            else:
+                slot = self._next
+                self._next = (self._next + 1) % self.max_entries
+                del self._slots[self.keys[slot]]
+                self.keys[slot] = key
+            self._slots[key] = slot
+        self.vectors[slot] = vector
+
+    def remove(self, key: str) -> bool:
+        """Drop ``key`` from the index (the last entry moves into its slot)"""
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return False
+        last = len(self.keys) - 1
+        if slot != last:
+            moved = self.keys[last]
+            self.keys[slot] = moved
+            self.vectors[slot] = self.vectors[last]
+            self._slots[moved] = slot
+        self.keys.pop()
+        return True
+
+    def search(self, vector) -> Tuple[Optional[str], float]:
+        """Return the closest key and its cosine similarity"""
+        if not self.keys:
+            return None, 0.0
+        scores = self.vectors[:len(self.keys)] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class SemanticCache:
+    """Semantic response cache tier in front of the model, behind the exact cache.
+
+    Prompts are embedded and matched against previously answered prompts for the
+    same copilot type and model. Index entries point at exact-cache keys, so a
+    semantic hit serves the stored response; an entry whose response has expired
+    is ``discard``ed when it is matched. Entries are persisted to a Redis list
+    (written through ``writer`` when given) and reloaded on startup.
+
+    Only context-free prompts (no conversation history) belong in this tier: a
+    paraphrase match says nothing about whether two conversations agree.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        embedder,
+        thresholds: Dict[str, float] = None,
+        max_entries: int = 10000,
+        writer=None
+    ):
+        self.redis = redis_client
+        self.writer = writer or redis_client
+        self.embedder = embedder
+        self.thresholds = thresholds or dict(DEFAULT_THRESHOLDS)
+        self.max_entries = max_entries
+        self.indexes: Dict[str, VectorIndex] = {}
+
+    @classmethod
+    def from_env(cls, redis_client, http_client=None, writer=None) -> Optional["SemanticCache"]:
+        """Build from SEMANTIC_CACHE_* settings; returns None when disabled"""
+        if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() != "true":
+            return None
+        if np is None:
+            print("[WARNING] SEMANTIC_CACHE_ENABLED is set but numpy is not installed; semantic cache disabled.")
+            return None
+
+        spec = os.getenv("SEMANTIC_CACHE_EMBEDDER")
+        embedder = load_embedder(spec) if spec else OllamaEmbedder(http_client)
+
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        for copilot_type in thresholds:
+            value = os.getenv(f"SEMANTIC_CACHE_THRESHOLD_{copilot_type.upper()}")
+            if value:
+                thresholds[copilot_type] = float(value)
+
+        return cls(
+            redis_client,
+            embedder,
+            thresholds=thresholds,
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+            writer=writer
+        )
+
+    def _index(self, namespace: str, dim: int) -> VectorIndex:
+        index = self.indexes.get(namespace)
+        if index is None:
+            index = self.indexes[namespace] = VectorIndex(dim, self.max_entries)
+        return index
+
+    async def load(self):
+        """Rebuild the in-process indexes from the persisted entries"""
+        for raw in await self.redis.lrange(INDEX_KEY, 0, -1):
+            try:
+                entry = json.loads(raw)
+                vector = np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32)
+            except (ValueError, KeyError):
+                continue
+            self._index(entry["namespace"], len(vector)).add(vector, entry["key"])
+
+    async def lookup(self, prompt: str, model: str, copilot_type: str) -> Dict:
+        """Find the cache key of a semantically similar, previously answered prompt.
+
+        Always returns the prompt embedding (for a later ``add``); ``key`` is set
+        only when the closest match clears the copilot type's threshold.
+        """
+        try:
+            vector = _normalize(await self.embedder.embed(prompt))
+        except Exception as e:
+            print(f"[WARNING] Semantic cache embedding failed: {e}")
+            return {"key": None, "embedding": None}
+
+        result = {"key": None, "embedding": vector, "similarity": 0.0}
+        index = self.indexes.get(f"{copilot_type}:{model}")
+        if index is None or index.dim != len(vector):
+            return result
+
+        key, similarity = index.search(vector)
+        result["similarity"] = similarity
+        threshold = self.thresholds.get(copilot_type, self.thresholds["general"])
+        if key and similarity >= threshold:
+            result["key"] = key
+        return result
+
+    async def add(self, cache_key: str, model: str, copilot_type: str, embedding):
+        """Index a freshly cached response under its prompt embedding"""
+        if embedding is None:
+            return
+        namespace = f"{copilot_type}:{model}"
+        self._index(namespace, len(embedding)).add(embedding, cache_key)
+
+        entry = {
+            "namespace": namespace,
+            "key": cache_key,
+            "vector": base64.b64encode(embedding.astype(np.float32).tobytes()).decode()
+        }
+        await self.writer.rpush(INDEX_KEY, json.dumps(entry))
+        await self.writer.ltrim(INDEX_KEY, -self.max_entries, -1)
+
+    def discard(self, cache_key: str, model: str, copilot_type: str):
+        """Drop an entry whose exact-cache response is gone, so it stops shadowing live matches"""
+        index = self.indexes.get(f"{copilot_type}:{model}")
+        if index is not None:
+            index.remove(cache_key)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of indexed prompts per copilot type/model"""
+        return {namespace: len(index) for namespace, index in self.indexes.items()}
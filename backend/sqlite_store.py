@@ -0,0 +1,302 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+# Expired keys reclaimed per write transaction, so purging stays O(1) amortized
+PURGE_BATCH = 32
+
+# Commands that never write; a batch of only these runs in a read transaction
+READ_COMMANDS = {"get", "mget", "lrange", "llen"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    is_list INTEGER NOT NULL DEFAULT 0,
+    expires REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires) WHERE expires IS NOT NULL;
+CREATE TABLE IF NOT EXISTS list_items (
+    key TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (key, pos)
+) WITHOUT ROWID;
+"""
+
+def _list_range(length: int, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """Redis-style (negative-aware, inclusive) index range clamped to a list of ``length``"""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    end = min(end, length - 1)
+    if start > end:
+        return None
+    return start, end
+
+class SqlitePipeline:
+    """Queues store commands and runs them in one SQLite transaction on execute()"""
+
+    def __init__(self, store: "SqliteStore"):
+        self.store = store
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return await self.store._execute(commands)
+
+class SqliteStore:
+    """Redis stand-in backed by a SQLite database in WAL mode.
+
+    Unlike MemoryStore, the state lives in a file, so every worker process on the
+    host (e.g. ``uvicorn --workers 4``) shares rate limits, cached responses and
+    conversations. Write batches run in ``BEGIN IMMEDIATE`` transactions, which
+    makes pipelines and scripts atomic across processes just like on Redis;
+    readers are never blocked by writers.
+
+    Each process uses one connection, driven from a single worker thread so the
+    event loop never waits on disk or on another process's write lock. Strings
+    live in ``kv``; lists are a ``kv`` row plus contiguous positions in
+    ``list_items``. Expiry is lazy: reads ignore expired keys and each write
+    transaction deletes a few of them.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor.submit(self._connect).result()
+
+    @classmethod
+    def from_env(cls, path: Optional[str] = None) -> "SqliteStore":
+        """Build from SQLITE_STORE_PATH / SQLITE_BUSY_TIMEOUT"""
+        return cls(
+            path=path or os.getenv("SQLITE_STORE_PATH", "copilot_state.db"),
+            busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+        )
+
+    def _connect(self):
+        # Autocommit mode; transactions are opened explicitly in _transaction
+        self._conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Durable across process crashes; only an OS crash can lose the last commits
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # Transactions (run on the store thread)
+
+    def _transaction(self, commands: List) -> List[Any]:
+        read_only = all(name in READ_COMMANDS for name, _, _ in commands)
+        self._conn.execute("BEGIN" if read_only else "BEGIN IMMEDIATE")
+        try:
+            results = [getattr(self, f"sync_{name}")(*args, **kwargs) for name, args, kwargs in commands]
+            if not read_only:
+                self._purge_expired()
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _execute(self, commands: List) -> List[Any]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._transaction, commands)
+
+    async def _call(self, name: str, *args, **kwargs):
+        return (await self._execute([(name, args, kwargs)]))[0]
+
+    # Synchronous core (inside a transaction), also used by scripts
+
+    def _row(self, key: str):
+        """(value, is_list) of a live key, or None"""
+        row = self._conn.execute(
+            "SELECT value, is_list FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row
+
+    def _remove(self, key: str):
+        self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        self._conn.execute("DELETE FROM list_items WHERE key = ?", (key,))
+
+    def _purge_expired(self):
+        expired = self._conn.execute(
+            "SELECT key FROM kv WHERE expires <= ? LIMIT ?", (time.time(), PURGE_BATCH)
+        ).fetchall()
+        for (key,) in expired:
+            self._remove(key)
+
+    def _list_bounds(self, key: str) -> Optional[Tuple[int, int]]:
+        row = self._row(key)
+        if row is None or not row[1]:
+            return None
+        lo, hi = self._conn.execute(
+            "SELECT MIN(pos), MAX(pos) FROM list_items WHERE key = ?", (key,)
+        ).fetchone()
+        return None if lo is None else (lo, hi)
+
+    def sync_get(self, key: str):
+        row = self._row(key)
+        return row[0] if row and not row[1] else None
+
+    def sync_mget(self, keys):
+        return [self.sync_get(key) for key in keys]
+
+    def sync_set(self, key: str, value, nx: bool = False, px: Optional[int] = None, ex: Optional[float] = None):
+        if nx and self._row(key) is not None:
+            return None
+        expires = None
+        if px is not None:
+            expires = time.time() + px / 1000
+        elif ex is not None:
+            expires = time.time() + ex
+        self._conn.execute("DELETE FROM list_items WHERE key = ?", (key,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, is_list, expires) VALUES (?, ?, 0, ?)",
+            (key, value if isinstance(value, str) else str(value), expires)
+        )
+        return True
+
+    def sync_setex(self, key, seconds, value):
+        return self.sync_set(key, value, ex=seconds)
+
+    def sync_incr(self, key):
+        return self.sync_incrby(key, 1)
+
+    def sync_incrby(self, key, amount):
+        row = self._row(key)
+        value = int(row[0] if row and not row[1] else 0) + amount
+        if row is None or row[1]:
+            self.sync_set(key, str(value))
+        else:
+            # Keeps the key's TTL, like Redis
+            self._conn.execute("UPDATE kv SET value = ? WHERE key = ?", (str(value), key))
+        return value
+
+    def sync_lrange(self, key, start, end):
+        bounds = self._list_bounds(key)
+        if bounds is None:
+            return []
+        lo, hi = bounds
+        span = _list_range(hi - lo + 1, start, end)
+        if span is None:
+            return []
+        rows = self._conn.execute(
+            "SELECT value FROM list_items WHERE key = ? AND pos BETWEEN ? AND ? ORDER BY pos",
+            (key, lo + span[0], lo + span[1])
+        ).fetchall()
+        return [value for (value,) in rows]
+
+    def sync_llen(self, key):
+        bounds = self._list_bounds(key)
+        return bounds[1] - bounds[0] + 1 if bounds else 0
+
+    def sync_rpush(self, key, value):
+        bounds = self._list_bounds(key)
+        if bounds is None:
+            # New list (replacing an expired key or a string)
+            self._remove(key)
+            self._conn.execute("INSERT INTO kv (key, value, is_list, expires) VALUES (?, NULL, 1, NULL)", (key,))
+            bounds = (0, -1)
+        lo, hi = bounds
+        self._conn.execute("INSERT INTO list_items (key, pos, value) VALUES (?, ?, ?)", (key, hi + 1, value))
+        return hi + 2 - lo
+
+    def sync_ltrim(self, key, start, end):
+        bounds = self._list_bounds(key)
+        if bounds is None:
+            return True
+        lo, hi = bounds
+        span = _list_range(hi - lo + 1, start, end)
+        if span is None:
+            self._remove(key)
+            return True
+        self._conn.execute(
+            "DELETE FROM list_items WHERE key = ? AND (pos < ? OR pos > ?)",
+            (key, lo + span[0], lo + span[1])
+        )
+        return True
+
+    def sync_expire(self, key, seconds):
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE kv SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (now + seconds, key, now)
+        )
+        return cursor.rowcount > 0
+
+    def sync_delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._row(key) is not None:
+                deleted += 1
+            self._remove(key)
+        return deleted
+
+    def sync_run_script(self, script, keys, args):
+        # Runs inside the batch's transaction, so it is atomic across processes
+        return script.local(self, keys, args)
+
+    # Redis-compatible async API
+
+    async def get(self, key):
+        return await self._call("get", key)
+
+    async def mget(self, keys):
+        return await self._call("mget", keys)
+
+    async def set(self, key, value, nx=False, px=None, ex=None):
+        return await self._call("set", key, value, nx=nx, px=px, ex=ex)
+
+    async def setex(self, key, time, value):
+        return await self._call("setex", key, time, value)
+
+    async def incr(self, key):
+        return await self._call("incr", key)
+
+    async def incrby(self, key, amount):
+        return await self._call("incrby", key, amount)
+
+    async def lrange(self, key, start, end):
+        return await self._call("lrange", key, start, end)
+
+    async def llen(self, key):
+        return await self._call("llen", key)
+
+    async def rpush(self, key, value):
+        return await self._call("rpush", key, value)
+
+    async def ltrim(self, key, start, end):
+        return await self._call("ltrim", key, start, end)
+
+    async def expire(self, key, time):
+        return await self._call("expire", key, time)
+
+    async def delete(self, *keys):
+        return await self._call("delete", *keys)
+
+    def pipeline(self, transaction=True):
+        return SqlitePipeline(self)
+
+    async def run_script(self, script, keys, args):
+        return await self._call("run_script", script, keys, args)
+
+    async def ping(self):
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: self._conn.execute("SELECT 1").fetchone()
+        )
+        return True
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown(wait=False)
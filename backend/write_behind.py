@@ -0,0 +1,125 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Tuple
+
+class WriteBehindQueue:
+    """Moves cache and conversation writes off the response critical path.
+
+    Writes are queued in memory and flushed by a background task as one pipelined
+    transaction, either every ``flush_interval`` seconds or as soon as
+    ``max_batch`` writes are waiting. The write methods mirror the Redis client
+    (``setex``, ``rpush``, ``ltrim``, ``expire``) so callers can use the queue as
+    a drop-in writer. Once ``max_pending`` writes are queued, writers wait for a
+    flush instead of growing the queue without bound.
+
+    Readers call ``sync(key)`` before reading a key: if writes to it are still
+    queued they are flushed first, which gives read-your-writes per session.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_batch: int = 64,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000
+    ):
+        self.redis = redis_client
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._ops: List[Tuple[str, Tuple[Any, ...]]] = []
+        self._pending_keys: Dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @classmethod
+    def from_env(cls, redis_client) -> "WriteBehindQueue":
+        """Build from WRITE_BEHIND_MAX_BATCH / WRITE_BEHIND_FLUSH_INTERVAL / WRITE_BEHIND_MAX_PENDING"""
+        return cls(
+            redis_client,
+            max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "64")),
+            flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05")),
+            max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+        )
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and drain everything still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def depth(self) -> int:
+        """Number of queued writes"""
+        return len(self._ops)
+
+    async def setex(self, key: str, ttl: int, value: str):
+        await self._enqueue(key, "setex", (key, ttl, value))
+
+    async def rpush(self, key: str, value: str):
+        await self._enqueue(key, "rpush", (key, value))
+
+    async def ltrim(self, key: str, start: int, end: int):
+        await self._enqueue(key, "ltrim", (key, start, end))
+
+    async def expire(self, key: str, ttl: int):
+        await self._enqueue(key, "expire", (key, ttl))
+
+    async def sync(self, key: str):
+        """Flush queued writes if any target ``key`` (read-your-writes)"""
+        if self._pending_keys.get(key):
+            await self.flush()
+
+    async def _enqueue(self, key: str, command: str, args: Tuple[Any, ...]):
+        if len(self._ops) >= self.max_pending:
+            await self.flush()
+            if len(self._ops) >= self.max_pending:
+                # Redis is unreachable: shed the oldest writes rather than grow forever
+                print(f"[WARNING] Write-behind queue full; dropping {self.max_batch} oldest writes")
+                self._discard(self.max_batch)
+        self._ops.append((command, args))
+        self._pending_keys[key] = self._pending_keys.get(key, 0) + 1
+        if len(self._ops) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write everything queued so far in pipelined transactions"""
+        async with self._flush_lock:
+            while self._ops:
+                batch = self._ops[:self.max_batch]
+                pipe = self.redis.pipeline(transaction=True)
+                for command, args in batch:
+                    getattr(pipe, command)(*args)
+                try:
+                    await pipe.execute()
+                except Exception as e:
+                    # Leave the batch queued; it is retried on the next flush
+                    print(f"[WARNING] Write-behind flush failed ({len(batch)} writes pending): {e}")
+                    return
+                self._discard(len(batch))
+
+    def _discard(self, count: int):
+        """Remove the oldest ``count`` writes from the queue"""
+        for _, args in self._ops[:count]:
+            key = args[0]
+            self._pending_keys[key] -= 1
+            if not self._pending_keys[key]:
+                del self._pending_keys[key]
+        del self._ops[:count]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import socket
+import time
+import uuid
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+class ProviderProfile:
+    """Simulated behaviour of one provider: time to first token and generation speed"""
+
+    def __init__(self, latency: float, tokens_per_second: float, output_tokens: int, jitter: float = 0.2):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.jitter = jitter
+
+    def first_token_delay(self) -> float:
+        return self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def generation_time(self) -> float:
+        return self.first_token_delay() + self.output_tokens * self.token_delay()
+
+# Rough shape of each provider; overridden from the bench command line
+DEFAULT_PROFILES = {
+    "openai": ProviderProfile(latency=0.25, tokens_per_second=400, output_tokens=60),
+    "anthropic": ProviderProfile(latency=0.3, tokens_per_second=300, output_tokens=60),
+    "ollama": ProviderProfile(latency=0.1, tokens_per_second=150, output_tokens=60),
+}
+
+def prompt_tokens(messages: List[Dict]) -> int:
+    """Same 4-characters-per-token estimate the backend uses"""
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") for block in content)
+        total += math.ceil(len(content) / 4) + 4
+    return total
+
+def completion_tokens(count: int) -> List[str]:
+    return [f"tok{i} " for i in range(count)]
+
+def embedding(text: str, dimensions: int = 64) -> List[float]:
+    """Deterministic pseudo-embedding so identical prompts embed identically"""
+    digest = hashlib.sha256(text.encode()).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+def create_app(profiles: Dict[str, ProviderProfile] = None) -> FastAPI:
+    """One app answering the OpenAI, Anthropic and Ollama endpoints the backend calls"""
+    profiles = profiles or DEFAULT_PROFILES
+    app = FastAPI(title="Fake model providers")
+    app.state.requests = {name: 0 for name in profiles}
+    # Ollama models that have been used, reported as resident by /api/ps
+    app.state.ollama_models = set()
+
+    # OpenAI: POST /v1/chat/completions
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        profile = profiles["openai"]
+        app.state.requests["openai"] += 1
+        usage = {
+            "prompt_tokens": prompt_tokens(body["messages"]),
+            "completion_tokens": profile.output_tokens,
+            "total_tokens": prompt_tokens(body["messages"]) + profile.output_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(profile.generation_time())
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(completion_tokens(profile.output_tokens))},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        def chunk(delta: Dict, finish_reason=None, choices=True) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+            }
+            if not choices:
+                data["usage"] = usage
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events():
+            await asyncio.sleep(profile.first_token_delay())
+            yield chunk({"role": "assistant", "content": ""})
+            for token in completion_tokens(profile.output_tokens):
+                yield chunk({"content": token})
+                await asyncio.sleep(profile.token_delay())
+            yield chunk({}, finish_reason="stop")
+            if body.get("stream_options", {}).get("include_usage"):
+                yield chunk({}, choices=False)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Anthropic: POST /v1/messages
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        profile = profiles["anthropic"]
+        app.state.requests["anthropic"] += 1
+        system = body.get("system", [])
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        usage = {
+            "input_tokens": prompt_tokens(body["messages"] + [{"content": system}]),
+            "output_tokens": profile.output_tokens,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        }
+        message = {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body["model"],
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": usage,
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(profile.generation_time())
+            message["content"] = [{"type": "text", "text": "".join(completion_tokens(profile.output_tokens))}]
+            message["stop_reason"] = "end_turn"
+            return message
+
+        def event(name: str, data: Dict) -> str:
+            return f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n"
+
+        async def events():
+            await asyncio.sleep(profile.first_token_delay())
+            yield event("message_start", {"message": {**message, "usage": {**usage, "output_tokens": 1}}})
+            yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+            for token in completion_tokens(profile.output_tokens):
+                yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": token}})
+                await asyncio.sleep(profile.token_delay())
+            yield event("content_block_stop", {"index": 0})
+            yield event("message_delta", {
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": profile.output_tokens},
+            })
+            yield event("message_stop", {})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Ollama: POST /api/chat and /api/embeddings, GET /api/ps and /api/tags
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await request.json()
+        profile = profiles["ollama"]
+        app.state.ollama_models.add(body["model"] if ":" in body["model"] else f"{body['model']}:latest")
+        if not body["messages"]:
+            # Load request (warm-up / keep-alive ping); the fake model is always resident
+            return {"model": body["model"], "message": {"role": "assistant", "content": ""}, "done_reason": "load", "done": True}
+        app.state.requests["ollama"] += 1
+        counts = {"prompt_eval_count": prompt_tokens(body["messages"]), "eval_count": profile.output_tokens}
+
+        def reply(content: str, done: bool) -> Dict:
+            return {
+                "model": body["model"],
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+
+        if not body.get("stream", True):
+            await asyncio.sleep(profile.generation_time())
+            return {**reply("".join(completion_tokens(profile.output_tokens)), True), **counts}
+
+        async def lines():
+            await asyncio.sleep(profile.first_token_delay())
+            for token in completion_tokens(profile.output_tokens):
+                yield json.dumps(reply(token, False)) + "\n"
+                await asyncio.sleep(profile.token_delay())
+            yield json.dumps({**reply("", True), **counts}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/api/ps")
+    async def ollama_ps():
+        models = [{"name": name, "model": name, "size": 0} for name in sorted(app.state.ollama_models)]
+        return {"models": models}
+
+    @app.get("/api/tags")
+    async def ollama_tags():
+        models = [{"name": name, "model": name, "size": 0} for name in sorted(app.state.ollama_models)]
+        return {"models": models}
+
+    @app.post("/api/embeddings")
+    async def ollama_embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(0.005)
+        return {"embedding": embedding(body.get("prompt", ""))}
+
+    return app
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class BackgroundServer:
+    """Serves an ASGI app with uvicorn on a loopback port inside the running event loop"""
+
+    def __init__(self, app, port: int = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False, lifespan="on"
+        ))
+        # Signals belong to the bench runner, not the embedded server
+        self.server.install_signal_handlers = lambda: None
+        self._task = None
+
+    async def start(self, timeout: float = 30.0):
+        self._task = asyncio.create_task(self.server.serve())
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if self._task.done():
+                # Surface startup errors (e.g. the port is taken)
+                self._task.result()
+                raise RuntimeError(f"Server on port {self.port} exited during startup")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server on port {self.port} did not start within {timeout:.0f}s")
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        if self._task:
+            self.server.should_exit = True
+            await self._task
@@ -0,0 +1,236 @@
+"""Load test the copilot API in-process against fake model providers.
+
+Usage (from the repository root):
+    python -m bench.run                       # run every scenario, compare with bench/baseline.json
+    python -m bench.run --save-baseline       # record the current numbers as the new baseline
+    python -m bench.run --scenarios stream,burst --scale 0.5 --latency 0.5
+
+Exits with status 1 when a scenario regressed against the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+from .fake_providers import DEFAULT_PROFILES, BackgroundServer, ProviderProfile, create_app
+from .scenarios import SCENARIOS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Startup changes smaller than this are noise, whatever the tolerance
+STARTUP_NOISE_MS = 50
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the copilot API against fake providers")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--models", default="gpt4,gpt35,local", help="model choices the traffic is spread over")
+    parser.add_argument("--burst-model", default="local", help="model hit by the burst scenario")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the number of requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per scenario")
+    parser.add_argument("--latency", type=float, help="provider time to first token in seconds (all providers)")
+    parser.add_argument("--tokens-per-second", type=float, help="provider generation speed (all providers)")
+    parser.add_argument("--output-tokens", type=int, help="tokens per provider response (all providers)")
+    parser.add_argument("--redis-url", default="memory://", help="Redis for the app (default: embedded memory store)")
+    parser.add_argument("--warm-models", default="", help="WARM_MODELS for the app (loaded during startup)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95/throughput change")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--json", dest="json_path", help="write the raw results as JSON")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.scenarios.split(",") if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+    return args
+
+def build_profiles(args: argparse.Namespace) -> Dict[str, ProviderProfile]:
+    profiles = {}
+    for name, default in DEFAULT_PROFILES.items():
+        profiles[name] = ProviderProfile(
+            latency=default.latency if args.latency is None else args.latency,
+            tokens_per_second=default.tokens_per_second if args.tokens_per_second is None else args.tokens_per_second,
+            output_tokens=default.output_tokens if args.output_tokens is None else args.output_tokens,
+            jitter=default.jitter
+        )
+    return profiles
+
+def configure_environment(args: argparse.Namespace, providers_url: str):
+    """Point the backend at the fake providers; must run before backend.main is imported"""
+    os.environ.update({
+        "REDIS_URL": args.redis_url,
+        "OPENAI_BASE_URL": f"{providers_url}/v1",
+        "ANTHROPIC_BASE_URL": providers_url,
+        "OLLAMA_BASE_URL": providers_url,
+        # Never send real credentials to the fakes
+        "OPENAI_API_KEY": "bench",
+        "ANTHROPIC_API_KEY": "bench",
+        # All traffic comes from one client IP and API key
+        "RATE_LIMIT": "1000000",
+        "API_KEY_RATE_LIMIT": "1000000",
+        "MEMORY_STORE_SNAPSHOT_PATH": "",
+        "WARM_MODELS": args.warm_models,
+    })
+
+def measure_import() -> float:
+    """Seconds to import backend.main in a fresh interpreter, as a cold container would"""
+    code = "import time; started = time.perf_counter(); import backend.main; print(time.perf_counter() - started)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, env=os.environ, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def compare(run: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of ``run`` against ``baseline`` (startup, p95 latency, throughput, error rate)"""
+    regressions = []
+    for key, label in (("import_ms", "import"), ("startup_ms", "startup")):
+        if baseline.get(key) and run[key] > max(baseline[key] * (1 + tolerance), baseline[key] + STARTUP_NOISE_MS):
+            regressions.append(f"{label} {run[key]:.0f}ms vs baseline {baseline[key]:.0f}ms")
+
+    for name, current in run["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        if previous.get("p95_ms") and current.get("p95_ms", 0) > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']:.1f}ms vs baseline {previous['p95_ms']:.1f}ms")
+        if previous.get("throughput") and current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['throughput']:.1f}/s vs baseline {previous['throughput']:.1f}/s"
+            )
+        if current["error_rate"] > previous.get("error_rate", 0.0) + 0.05:
+            regressions.append(
+                f"{name}: error rate {current['error_rate']:.1%} vs baseline {previous.get('error_rate', 0.0):.1%}"
+            )
+    return regressions
+
+def format_report(run: Dict, regressions: List[str], baseline_path: str, has_baseline: bool) -> str:
+    columns = ("scenario", "endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "ttft p50", "ttft p95")
+    rows = []
+    for name, summary in run["scenarios"].items():
+        rows.append((
+            name,
+            summary["endpoint"],
+            str(summary["requests"]),
+            str(sum(summary["errors"].values())),
+            f"{summary['throughput']:.1f}",
+            *(f"{summary[key]:.1f}" if key in summary else "-"
+              for key in ("p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms")),
+        ))
+    widths = [max(len(row[i]) for row in [columns, *rows]) for i in range(len(columns))]
+
+    lines = [
+        f"Copilot benchmark ({run['settings']['redis_url']}, models {','.join(run['settings']['models'])}, "
+        f"scale {run['settings']['scale']})",
+        f"Import: {run['import_ms']:.0f}ms (fresh interpreter), app startup: {run['startup_ms']:.0f}ms"
+        + (f" (warm models: {run['settings']['warm_models']})" if run["settings"]["warm_models"] else ""),
+        "",
+        "  ".join(column.ljust(width) for column, width in zip(columns, widths)),
+        "  ".join("-" * width for width in widths),
+    ]
+    lines += ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+    for name, summary in run["scenarios"].items():
+        if summary["errors"]:
+            lines.append(f"{name} errors: " + ", ".join(f"{reason} x{count}" for reason, count in summary["errors"].items()))
+    lines.append("Provider calls: " + ", ".join(f"{name} {count}" for name, count in run["provider_calls"].items()))
+    lines.append("")
+
+    if not has_baseline:
+        lines.append(f"No baseline at {baseline_path} (record one with --save-baseline)")
+    elif regressions:
+        lines.append(f"REGRESSIONS against {baseline_path}:")
+        lines += [f"  {regression}" for regression in regressions]
+    else:
+        lines.append(f"No regressions against {baseline_path}")
+    return "\n".join(lines)
+
+async def run(args: argparse.Namespace) -> Dict:
+    providers_app = create_app(build_profiles(args))
+    providers = BackgroundServer(providers_app)
+    await providers.start()
+    configure_environment(args, providers.url)
+    import_seconds = measure_import()
+
+    # Imported late so the module-level settings pick up the environment above
+    from backend import main
+
+    server = BackgroundServer(main.app)
+    started = time.perf_counter()
+    await server.start()
+    startup = time.perf_counter() - started
+
+    settings = {
+        "models": args.models.split(","),
+        "burst_model": args.burst_model,
+        "scale": args.scale,
+        "concurrency": args.concurrency,
+        "run_id": uuid.uuid4().hex[:8],
+    }
+    results = {}
+    try:
+        async with httpx.AsyncClient(
+            base_url=server.url,
+            headers={"Authorization": "Bearer test_key"},
+            timeout=120.0,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        ) as client:
+            for name in args.scenarios.split(","):
+                print(f"[INFO] Running scenario {name}...", file=sys.stderr)
+                result = await SCENARIOS[name](client, settings)
+                results[name] = result.summary()
+    finally:
+        await server.stop()
+        await providers.stop()
+
+    return {
+        "settings": {
+            "models": settings["models"],
+            "burst_model": args.burst_model,
+            "scale": args.scale,
+            "concurrency": args.concurrency,
+            "redis_url": args.redis_url,
+            "warm_models": args.warm_models,
+        },
+        "import_ms": round(import_seconds * 1000, 1),
+        "startup_ms": round(startup * 1000, 1),
+        "provider_calls": dict(providers_app.state.requests),
+        "scenarios": results,
+    }
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != result["settings"]:
+            print("[WARNING] Benchmark settings differ from the baseline's; comparison may be meaningless", file=sys.stderr)
+    regressions = compare(result, baseline, args.tolerance) if baseline else []
+
+    report = format_report(result, regressions, args.baseline, baseline is not None)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"[INFO] Baseline written to {args.baseline}")
+        return 0
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.router import percentile
+
+class ScenarioResult:
+    """Latencies and failures collected while one scenario runs"""
+
+    def __init__(self, name: str, endpoint: str):
+        self.name = name
+        self.endpoint = endpoint
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.elapsed = 0.0
+
+    def error(self, reason: str):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def summary(self) -> Dict:
+        """Throughput and latency percentiles (milliseconds) of the successful requests"""
+        count = len(self.latencies) + sum(self.errors.values())
+        summary = {
+            "endpoint": self.endpoint,
+            "requests": count,
+            "errors": dict(self.errors),
+            "error_rate": round(sum(self.errors.values()) / count, 4) if count else 0.0,
+            "throughput": round(len(self.latencies) / self.elapsed, 2) if self.elapsed else 0.0,
+        }
+        for label, samples in (("", self.latencies), ("ttft_", self.first_token)):
+            if samples:
+                for q in (50, 95, 99):
+                    summary[f"{label}p{q}_ms"] = round(percentile(samples, q / 100) * 1000, 1)
+        return summary
+
+async def post_json(client: httpx.AsyncClient, result: ScenarioResult, path: str, payload: Dict) -> Optional[Dict]:
+    started = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+    except httpx.HTTPError as e:
+        result.error(type(e).__name__)
+        return None
+    if response.status_code != 200:
+        result.error(str(response.status_code))
+        return None
+    result.latencies.append(time.perf_counter() - started)
+    return response.json()
+
+async def post_stream(client: httpx.AsyncClient, result: ScenarioResult, path: str, payload: Dict):
+    """POST to an SSE endpoint, recording time to the first token and to the done event"""
+    started = time.perf_counter()
+    event = None
+    first_token = None
+    try:
+        async with client.stream("POST", path, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result.error(str(response.status_code))
+                return
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                elif event == "error" and line.startswith("data: "):
+                    result.error("stream_error")
+                    return
+                elif event == "done":
+                    break
+    except httpx.HTTPError as e:
+        result.error(type(e).__name__)
+        return
+    if event != "done":
+        result.error("incomplete")
+        return
+    result.latencies.append(time.perf_counter() - started)
+    if first_token is not None:
+        result.first_token.append(first_token)
+
+async def post_batch(client: httpx.AsyncClient, result: ScenarioResult, payload: Dict):
+    """POST a batch and read its NDJSON lines; item errors count as errors"""
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", "/copilot/batch", json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result.error(str(response.status_code))
+                return
+            async for line in response.aiter_lines():
+                if line and "error" in json.loads(line):
+                    result.error("item_error")
+    except httpx.HTTPError as e:
+        result.error(type(e).__name__)
+        return
+    result.latencies.append(time.perf_counter() - started)
+
+async def run_bounded(jobs, concurrency: int):
+    """Await the job coroutines with at most ``concurrency`` running at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job):
+        async with semaphore:
+            await job
+
+    await asyncio.gather(*(bounded(job) for job in jobs))
+
+def unique_prompt(topic: str) -> str:
+    return f"{topic} ({uuid.uuid4().hex[:8]})"
+
+def pooled_prompt(settings: Dict, index: int) -> str:
+    """A popular prompt; tagged with the run id so a persistent Redis starts cold every run"""
+    return f"{PROMPT_POOL[index % len(PROMPT_POOL)]} [{settings['run_id']}]"
+
+PROMPT_POOL = [
+    "How do I reverse a list in Python?",
+    "Explain the difference between let and const",
+    "What does a KeyError mean?",
+    "Write a function that checks for palindromes",
+    "How do I read a file line by line?",
+    "Explain async/await in simple terms",
+    "Why is my recursive function slow?",
+    "How do I sort a dictionary by value?",
+]
+
+async def cache_hits(client: httpx.AsyncClient, settings: Dict) -> ScenarioResult:
+    """Popular prompts asked by many fresh sessions: mostly exact cache hits after warm-up"""
+    result = ScenarioResult("cache_hits", "/copilot")
+    jobs = [
+        post_json(client, result, "/copilot", {
+            "prompt": pooled_prompt(settings, i),
+            "model": settings["models"][(i // len(PROMPT_POOL)) % len(settings["models"])],
+            "session_id": f"bench-cache-{uuid.uuid4().hex}",
+        })
+        for i in range(int(200 * settings["scale"]))
+    ]
+    started = time.perf_counter()
+    await run_bounded(jobs, settings["concurrency"])
+    result.elapsed = time.perf_counter() - started
+    return result
+
+async def long_sessions(client: httpx.AsyncClient, settings: Dict) -> ScenarioResult:
+    """Sessions with many turns each: history reads, context packing and summaries"""
+    result = ScenarioResult("long_sessions", "/copilot/python")
+    sessions = max(1, int(8 * settings["scale"]))
+    turns = 16
+
+    async def session(index: int):
+        session_id = f"bench-session-{uuid.uuid4().hex}"
+        model = settings["models"][index % len(settings["models"])]
+        for turn in range(turns):
+            await post_json(client, result, "/copilot/python", {
+                "prompt": unique_prompt(f"Step {turn}: refactor the parser and explain the change"),
+                "model": model,
+                "session_id": session_id,
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(index) for index in range(sessions)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+async def burst(client: httpx.AsyncClient, settings: Dict) -> ScenarioResult:
+    """A spike of simultaneous uncached requests to one model (admission control sheds the excess)"""
+    model = settings["burst_model"]
+    result = ScenarioResult("burst", f"/copilot ({model})")
+    jobs = [
+        post_json(client, result, "/copilot", {
+            "prompt": unique_prompt("Explain this stack trace"),
+            "model": model,
+            "session_id": f"bench-burst-{uuid.uuid4().hex}",
+        })
+        for _ in range(int(48 * settings["scale"]))
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*jobs)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+async def stream(client: httpx.AsyncClient, settings: Dict) -> ScenarioResult:
+    """Uncached streaming requests; also reports time to first token"""
+    result = ScenarioResult("stream", "/copilot/stream")
+    jobs = [
+        post_stream(client, result, "/copilot/stream", {
+            "prompt": unique_prompt("Walk me through this function"),
+            "model": settings["models"][i % len(settings["models"])],
+            "session_id": f"bench-stream-{uuid.uuid4().hex}",
+        })
+        for i in range(int(48 * settings["scale"]))
+    ]
+    started = time.perf_counter()
+    await run_bounded(jobs, settings["concurrency"])
+    result.elapsed = time.perf_counter() - started
+    return result
+
+async def batch(client: httpx.AsyncClient, settings: Dict) -> ScenarioResult:
+    """Batches mixing repeated (cacheable) and new prompts"""
+    result = ScenarioResult("batch", "/copilot/batch")
+
+    def items():
+        for i in range(20):
+            prompt = pooled_prompt(settings, i) if i % 2 else unique_prompt("Explain lint warning")
+            yield {"id": f"item-{i}", "prompt": prompt, "model": settings["models"][i % len(settings["models"])]}
+
+    jobs = [post_batch(client, result, {"items": list(items())}) for _ in range(max(1, int(6 * settings["scale"])))]
+    started = time.perf_counter()
+    await run_bounded(jobs, 2)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+SCENARIOS = {
+    "cache_hits": cache_hits,
+    "long_sessions": long_sessions,
+    "burst": burst,
+    "stream": stream,
+    "batch": batch,
+}
@@ -1,10 +1,27 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+import hashlib
 import json
+import os
+import re
 import uuid
 import pyperclip
 from datetime import datetime
 
+# Backend location and timeouts. The read timeout bounds the silence between two
+# streamed chunks, not the whole generation, so long answers are never cut off.
+API_URL = os.getenv("COPILOT_API_URL", "http://localhost:8000")
+CONNECT_TIMEOUT = float(os.getenv("COPILOT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("COPILOT_READ_TIMEOUT", "120"))
+
+# Messages rendered at once, and kept in the browser session; older ones are
+# paged in on demand (from the backend's /history once they have been dropped)
+PAGE_SIZE = int(os.getenv("COPILOT_PAGE_SIZE", "20"))
+MAX_MESSAGES = int(os.getenv("COPILOT_MAX_MESSAGES", "200"))
+
+CODE_PATTERN = re.compile(r'```(\w+)?\n(.*?)```', re.DOTALL)
+
 # Page config
 st.set_page_config(
     page_title="AI Copilot Agent",
@@ -72,10 +89,154 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """HTTP session shared by all reruns and browser sessions (keeps connections to the backend open)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def stream_copilot(response: requests.Response, result: dict):
+    """Yield the tokens of a Server-Sent Events response as they arrive.
+
+    The ``done`` event's metadata (or the ``error`` event's detail) is stored in ``result``.
+    """
+    response.encoding = "utf-8"
+    event = None
+    # chunk_size=None hands over each event as soon as it is received
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):])
+            if event == "token":
+                yield data["token"]
+            elif event == "done":
+                result["done"] = data
+            elif event == "error":
+                result["error"] = data.get("detail", "Unknown error")
+                return
+
+def new_message(role: str, content: str, timestamp: str, stored: bool = False, **fields) -> dict:
+    """A conversation entry; ``id`` keeps its widget keys stable across reruns"""
+    return {
+        "id": uuid.uuid4().hex,
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        # Whether the backend keeps it in the session's history (cached answers are not stored)
+        "stored": stored,
+        **fields
+    }
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def render_assistant(digest: str, _content: str):
+    """HTML body and code blocks of an assistant message, computed once per distinct content"""
+    blocks = []
+    
+    def replace_code_block(match):
+        lang = match.group(1) or 'text'
+        code = match.group(2)
+        code_id = f"{digest}-{len(blocks)}"
+        blocks.append((lang, code))
+        escaped = code.replace('`', '\\`')
+        
+        return f'''
+        <div class="code-block" id="code-{code_id}">
+            <button class="copy-btn" onclick="navigator.clipboard.writeText(`{escaped}`)">
+                📋 Copy
+            </button>
+            <pre><code class="language-{lang}">{code}</code></pre>
+        </div>
+        '''
+    
+    return CODE_PATTERN.sub(replace_code_block, _content), blocks
+
+def render_message(msg: dict):
+    if msg["role"] == "user":
+        st.markdown(f"""
+        <div class="chat-message user-message">
+            <div class="message-header">
+                <span>👤 You</span>
+                <span class="timestamp">{msg.get('timestamp', '')}</span>
+            </div>
+            <div>{msg['content']}</div>
+        </div>
+        """, unsafe_allow_html=True)
+        return
+    
+    # Code blocks are formatted once per message content, not on every rerun
+    digest = hashlib.sha256(msg['content'].encode()).hexdigest()[:16]
+    formatted_content, code_blocks = render_assistant(digest, msg['content'])
+    
+    st.markdown(f"""
+    <div class="chat-message assistant-message">
+        <div class="message-header">
+            <span>🤖 Assistant</span>
+            <span class="timestamp">{msg.get('timestamp', '')}</span>
+        </div>
+        <div>{formatted_content}</div>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Add manual copy buttons for code blocks
+    for index, (lang, code) in enumerate(code_blocks):
+        if st.button(f"📋 Copy {lang} code", key=f"copy_{msg['id']}_{index}"):
+            pyperclip.copy(code)
+            st.success("Copied to clipboard!")
+
+def load_older_messages():
+    """Prepend the page of stored messages preceding the ones in the session"""
+    offset = sum(1 for msg in st.session_state.messages if msg.get("stored"))
+    try:
+        response = get_http_session().get(
+            f"{API_URL}/history/{st.session_state.session_id}",
+            params={"limit": PAGE_SIZE, "offset": offset},
+            headers={"Authorization": f"Bearer {st.session_state.api_key}"},
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Could not load older messages: {str(e)}")
+        return
+    if response.status_code != 200:
+        st.error(f"Error {response.status_code}: {response.text}")
+        return
+    
+    data = response.json()
+    older = [
+        new_message(
+            msg["role"],
+            msg["content"],
+            datetime.fromtimestamp(msg["timestamp"]).strftime("%H:%M:%S") if msg.get("timestamp") else "",
+            stored=True
+        )
+        for msg in data["history"]
+    ]
+    st.session_state.messages[:0] = older
+    st.session_state.visible += len(older)
+    st.session_state.older_on_server = offset + len(older) < data["total"]
+
+def trim_messages():
+    """Keep at most MAX_MESSAGES in the session; dropped stored ones can be loaded again"""
+    excess = len(st.session_state.messages) - MAX_MESSAGES
+    if excess > 0:
+        if any(msg.get("stored") for msg in st.session_state.messages[:excess]):
+            st.session_state.older_on_server = True
+        del st.session_state.messages[:excess]
+        st.session_state.visible = min(st.session_state.visible, MAX_MESSAGES)
+
 # Initialize session state
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+if 'visible' not in st.session_state:
+    st.session_state.visible = PAGE_SIZE
+
+if 'older_on_server' not in st.session_state:
+    st.session_state.older_on_server = False
+
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 
@@ -125,10 +286,23 @@ with st.sidebar:
     if st.button("🔄 New Session"):
         st.session_state.session_id = str(uuid.uuid4())
         st.session_state.messages = []
+        st.session_state.visible = PAGE_SIZE
+        st.session_state.older_on_server = False
         st.rerun()
     
     if st.button("🧹 Clear History"):
+        # Also clear the backend's copy, which "Load older messages" reads from
+        try:
+            get_http_session().delete(
+                f"{API_URL}/history/{st.session_state.session_id}",
+                headers={"Authorization": f"Bearer {st.session_state.api_key}"},
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
+        except requests.exceptions.RequestException:
+            pass
         st.session_state.messages = []
+        st.session_state.visible = PAGE_SIZE
+        st.session_state.older_on_server = False
         st.rerun()
     
     # Stats
@@ -149,57 +323,23 @@ with col1:
     chat_container = st.container()
     
     with chat_container:
-        for msg in st.session_state.messages:
-            if msg["role"] == "user":
-                st.markdown(f"""
-                <div class="chat-message user-message">
-                    <div class="message-header">
-                        <span>👤 You</span>
-                        <span class="timestamp">{msg.get('timestamp', '')}</span>
-                    </div>
-                    <div>{msg['content']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                # Process assistant message with code blocks
-                content = msg['content']
-                
-                # Simple code block detection and formatting
-                import re
-                code_pattern = r'```(\w+)?\n(.*?)```'
-                
-                def replace_code_block(match):
-                    lang = match.group(1) or 'text'
-                    code = match.group(2)
-                    code_id = str(uuid.uuid4())
-                    
-                    return f'''
-                    <div class="code-block" id="code-{code_id}">
-                        <button class="copy-btn" onclick="navigator.clipboard.writeText(`{code.replace('`', '\\`')}`)">
-                            📋 Copy
-                        </button>
-                        <pre><code class="language-{lang}">{code}</code></pre>
-                    </div>
-                    '''
-                
-                formatted_content = re.sub(code_pattern, replace_code_block, content, flags=re.DOTALL)
-                
-                st.markdown(f"""
-                <div class="chat-message assistant-message">
-                    <div class="message-header">
-                        <span>🤖 Assistant</span>
-                        <span class="timestamp">{msg.get('timestamp', '')}</span>
-                    </div>
-                    <div>{formatted_content}</div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Add manual copy buttons for code blocks
-                code_blocks = re.findall(code_pattern, content, re.DOTALL)
-                for lang, code in code_blocks:
-                    if st.button(f"📋 Copy {lang} code", key=f"copy_{uuid.uuid4()}"):
-                        pyperclip.copy(code)
-                        st.success("Copied to clipboard!")
+        # Only the newest page(s) are rendered; older messages are one click away
+        messages = st.session_state.messages
+        hidden = max(0, len(messages) - st.session_state.visible)
+        if hidden:
+            if st.button(f"⬆️ Show older messages ({hidden} more)", key="show_older"):
+                st.session_state.visible += PAGE_SIZE
+                st.rerun()
+        elif st.session_state.older_on_server:
+            if st.button("⬆️ Load older messages", key="load_older"):
+                load_older_messages()
+                st.rerun()
+        
+        for msg in messages[len(messages) - min(len(messages), st.session_state.visible):]:
+            render_message(msg)
+        
+        # The answer being generated is streamed here, below the conversation
+        stream_slot = st.empty()
 
 with col2:
     # Input area
@@ -228,21 +368,20 @@ with col2:
     if st.button("🚀 Send", type="primary", use_container_width=True):
         if user_input.strip():
             # Add user message to session state
-            st.session_state.messages.append({
-                "role": "user",
-                "content": user_input,
-                "timestamp": datetime.now().strftime("%H:%M:%S")
-            })
+            user_message = new_message("user", user_input, datetime.now().strftime("%H:%M:%S"))
+            st.session_state.messages.append(user_message)
             
-            # Call backend API
-            with st.spinner("🤔 Thinking..."):
+            # Call backend API, rendering tokens as they are generated
+            with stream_slot.container():
+                st.markdown(f"**👤 You:** {user_input}")
                 try:
                     # Determine endpoint based on copilot type
-                    endpoint = f"http://localhost:8000/copilot"
+                    endpoint = f"{API_URL}/copilot"
                     if copilot_type != "general":
                         endpoint += f"/{copilot_type}"
+                    endpoint += "/stream"
                     
-                    response = requests.post(
+                    with get_http_session().post(
                         endpoint,
                         json={
                             "prompt": user_input,
@@ -250,33 +389,44 @@ with col2:
                             "model": model_choice
                         },
                         headers={"Authorization": f"Bearer {st.session_state.api_key}"},
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        # Add assistant message
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": data["response"],
-                            "timestamp": datetime.now().strftime("%H:%M:%S"),
-                            "model": data.get("model", "unknown"),
-                            "cached": data.get("cached", False)
-                        })
-                        
-                        # Show cache indicator
-                        if data.get("cached"):
-                            st.info("⚡ Response from cache")
-                        
-                        st.rerun()
-                    else:
-                        st.error(f"Error {response.status_code}: {response.text}")
+                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                        stream=True
+                    ) as response:
+                        if response.status_code == 200:
+                            result = {}
+                            st.markdown("**🤖 Assistant:**")
+                            answer = st.write_stream(stream_copilot(response, result))
+                            
+                            if "error" in result:
+                                st.error(f"❌ {result['error']}")
+                            else:
+                                data = result.get("done", {})
+                                
+                                # Add assistant message (already on screen, so no rerun is needed)
+                                user_message["stored"] = not data.get("cached", False)
+                                st.session_state.messages.append(new_message(
+                                    "assistant",
+                                    answer,
+                                    datetime.now().strftime("%H:%M:%S"),
+                                    stored=user_message["stored"],
+                                    model=data.get("routed_model", data.get("model", model_choice)),
+                                    cached=data.get("cached", False)
+                                ))
+                                
+                                # Show cache indicator
+                                if data.get("cached"):
+                                    st.info("⚡ Response from cache")
+                        else:
+                            st.error(f"Error {response.status_code}: {response.text}")
                         
                 except requests.exceptions.ConnectionError:
-                    st.error("❌ Cannot connect to backend. Make sure the server is running on port 8000")
+                    st.error(f"❌ Cannot connect to backend. Make sure the server is running at {API_URL}")
+                except requests.exceptions.Timeout:
+                    st.error(f"❌ The backend sent nothing for {READ_TIMEOUT:.0f}s")
                 except Exception as e:
                     st.error(f"❌ Request failed: {str(e)}")
+            
+            trim_messages()
         else:
             st.warning("⚠️ Please enter a question")
 